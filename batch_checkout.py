@@ -0,0 +1,152 @@
+# imports
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from decimal import Decimal
+
+from cart_import import add_records
+from main import ShoppingCart
+from pricing import PricingEngine
+
+"""
+Batch checkout of many saved carts at once, spread over a pool of worker processes. Each cart is given
+as (cart_id, data) where data is either the bytes of a cart exported by export_cart (a JSON array or
+NDJSON) or the path of such a file, which the worker then reads itself so the cart never passes
+through the parent process. Carts are sent to the workers in chunks so that the cost of handing work
+between processes is paid once per chunk rather than once per cart, and only a small result tuple comes
+back for each cart. A bounded number of chunks is in flight at once so the input can be a stream.
+
+For each cart the worker validates every product, works out the cart totals and, when pricing rules
+are given, the priced total with promotions and tax.
+"""
+
+CHUNK_SIZE = 64  # carts per task
+MAX_ERRORS_KEPT = 5  # errors returned per cart, the count is always complete
+
+CheckoutResult = namedtuple("CheckoutResult", ["cart_id", "lines", "units", "subtotal", "priced_total",
+                                               "error_count", "errors"])
+
+_engine = None  # the pricing engine of a worker process, set up once by _init_worker
+
+
+def _init_worker(rules, tax_rates):
+    global _engine
+    _engine = PricingEngine(rules, tax_rates) if rules is not None else None
+
+
+def _parse(data):  # the product records in an exported cart
+    if isinstance(data, str):  # a path, read by the worker
+        with open(data, "rb") as f:
+            data = f.read()
+    text = data.strip()
+    if text.startswith(b"["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def checkout_cart(cart_id, data, today=None, engine=None):  # validate and total a single serialized cart
+    try:
+        records = _parse(data)
+    except (OSError, ValueError) as e:
+        return CheckoutResult(cart_id, 0, 0, "0", None, 1, [str(e)])
+    if not isinstance(records, list):
+        return CheckoutResult(cart_id, 0, 0, "0", None, 1, ["cart is not a list of products"])
+    products = []
+    lines = []  # the record number, counting from 1, of each product in products
+    errors = []  # (record number, message)
+    for i, record in enumerate(records, 1):
+        if isinstance(record, dict):
+            products.append(record)
+            lines.append(i)
+        else:
+            errors.append((i, "product is not a JSON object"))
+    result = add_records(ShoppingCart(), products, today)
+    errors.extend((lines[e.line - 1], e.message) for e in result.errors)
+    errors.sort(key=lambda e: e[0])
+    totals = result.cart.totals()
+    priced_total = None
+    if engine is not None:
+        priced_total = str(engine.price_cart(result.cart)[1]["total"])
+    return CheckoutResult(cart_id, totals["lines"], totals["units"], str(totals["subtotal"]), priced_total,
+                          len(errors), ["record {}: {}".format(line, message)
+                                        for line, message in errors[:MAX_ERRORS_KEPT]])
+
+
+def _checkout_chunk(chunk):  # run in a worker process
+    today = datetime.today()
+    return [checkout_cart(cart_id, data, today, _engine) for cart_id, data in chunk]
+
+
+def _chunks(carts, size):
+    chunk = []
+    for cart in carts:
+        chunk.append(cart)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+"""
+run_batch_checkout function will check out every (cart_id, data) pair in carts over a pool of worker
+processes and yield a CheckoutResult per cart, in the order they finish
+"""
+
+
+def run_batch_checkout(carts, workers=None, chunk_size=CHUNK_SIZE, rules=None, tax_rates=None):
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rules, tax_rates)) as pool:
+        chunks = _chunks(carts, chunk_size)
+        pending = set()
+        while True:
+            while len(pending) < workers * 2:  # keep every worker busy without reading the whole input
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.add(pool.submit(_checkout_chunk, chunk))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for result in future.result():
+                    yield result
+
+
+BatchSummary = namedtuple("BatchSummary", ["carts", "lines", "units", "subtotal", "priced_total",
+                                           "invalid_carts", "errors", "seconds", "carts_per_second"])
+
+
+"""
+summarise_batch function will aggregate the CheckoutResults of a batch and time it. start is the
+time.perf_counter() when the batch began; without it the time is taken while reading results, which only
+measures the batch when results is the generator from run_batch_checkout, as its work is done as it is
+read. For results already collected (such as a list) and no start, seconds and carts_per_second are None
+"""
+
+
+def summarise_batch(results, start=None):
+    timed = start is not None or not hasattr(results, "__len__")
+    if start is None:
+        start = time.perf_counter()
+    carts = lines = units = invalid = errors = 0
+    subtotal = Decimal(0)
+    priced_total = None
+    for result in results:
+        carts = carts + 1
+        lines = lines + result.lines
+        units = units + result.units
+        subtotal = subtotal + Decimal(result.subtotal)
+        if result.priced_total is not None:
+            priced_total = (priced_total or Decimal(0)) + Decimal(result.priced_total)
+        if result.error_count:
+            invalid = invalid + 1
+            errors = errors + result.error_count
+    if not timed:
+        return BatchSummary(carts, lines, units, subtotal, priced_total, invalid, errors, None, None)
+    seconds = time.perf_counter() - start
+    return BatchSummary(carts, lines, units, subtotal, priced_total, invalid, errors, seconds,
+                        carts / seconds if seconds else 0.0)
@@ -0,0 +1,557 @@
+# imports
+import asyncio
+import copy
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+from batch_checkout import run_batch_checkout, summarise_batch, checkout_cart
+from binary_cart import BinaryCart, write_binary_cart
+from cart_export import export_cart, iter_export, product_record
+from cart_import import load_cart
+from cart_registry import CartRegistry
+from cart_server import CartServer
+from cart_snapshot import diff
+from cart_store import PersistentCart
+from commands import execute, run_command_file
+from expiry_index import ExpiryIndex
+from instrumentation import instrumented, Metrics
+from main import ShoppingCart, Clothing, Food, Toys
+from pricing import PricingEngine, CartPricing, MultiBuy, Discount
+from product_table import ProductTable
+from validation import validate_prices, validate_quantities, validate_ids, validate_sizes, validate_expiry_dates
+
+"""
+Benchmarks for the shopping cart. Run with:
+    python benchmark.py [name ...] [--max-size N] [--json results.json]
+                        [--baseline baseline.json] [--threshold 0.25] [--save-baseline baseline.json]
+Every benchmark runs over cart sizes from 10 up to 1M lines (or --max-size) and prints
+how long a single operation takes at each size, so it is easy to see how things scale.
+The name "core" runs the benchmarks of the cart core: cart_index, totals, products and export.
+
+Every timing is also recorded, and --json writes them all to a file. --baseline compares them with the
+results stored in an earlier file and exits with status 1 if any is slower than the baseline by more
+than the threshold (25% by default); --save-baseline stores this run as the new baseline. Timings of
+small carts are noisy, so compare runs made on the same machine at the same sizes.
+"""
+
+SIZES = [10, 100, 1000, 10000, 100000, 1000000]
+CORE = ["cart_index", "totals", "products", "export"]
+DEFAULT_THRESHOLD = 0.25
+RESULTS = []  # every timing of this run, as recorded by record()
+FIRST_ID = 1000000000000  # the smallest 13 digit id
+
+
+def make_clothing(n, start=0):  # synthetic clothing lines with unique 13 digit ids
+    return [Clothing("Shirt {}".format(i % 1000), 9.99, 1, "Brand", FIRST_ID + i, "M", "Cotton")
+            for i in range(start, start + n)]
+
+
+def make_products(n, start=0):  # synthetic lines of every product type
+    expiry_date = datetime(2099, 1, 1)
+    products = []
+    for i in range(start, start + n):
+        name = "Item {}".format(i % 1000)
+        brand = "Brand {}".format(i % 10)
+        if i % 3 == 0:
+            products.append(Clothing(name, 9.99, 1 + i % 5, brand, FIRST_ID + i, "M", "Cotton"))
+        elif i % 3 == 1:
+            products.append(Food(name, 1.25, 1 + i % 5, brand, FIRST_ID + i, expiry_date, i % 2 == 0, i % 4 == 1))
+        else:
+            products.append(Toys(name, 15.5, 1 + i % 5, brand, FIRST_ID + i, 3 + i % 10, "M" if i % 2 else "F"))
+    return products
+
+
+def make_cart(n):  # a cart holding n synthetic lines
+    cart = ShoppingCart()
+    for p in make_clothing(n):
+        cart.addProduct(p)
+    return cart
+
+
+def time_per_op(func, repeat):  # average seconds taken by one call of func
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return (time.perf_counter() - start) / repeat
+
+
+def record(name, size, seconds):  # keep a result for --json and --baseline
+    RESULTS.append({"name": name, "size": size, "us_per_op": seconds * 1e6})
+
+
+def report(name, size, seconds):  # print a single benchmark result
+    print("\t{:<28} {:>8} lines  {:>10.3f} us/op".format(name, size, seconds * 1e6))
+    record(name, size, seconds)
+
+
+def bench_cart_index(sizes):  # add, lookup, quantity change and remove against carts of growing size
+    print("Indexed cart operations:")
+    for size in sizes:
+        cart = make_cart(size)
+        repeat = min(size, 1000)
+        extra = make_clothing(repeat, start=size)
+        report("addProduct", size, time_per_op(lambda i: cart.addProduct(extra[i]), repeat))
+        report("getProduct", size, time_per_op(lambda i: cart.getProduct(FIRST_ID + i), repeat))
+        report("hasProduct", size, time_per_op(lambda i: cart.hasProduct(FIRST_ID + i), repeat))
+        report("changeProductQuantity", size, time_per_op(lambda i: cart.changeProductQuantity(FIRST_ID + i, 2),
+                                                          repeat))
+        report("removeProduct", size, time_per_op(lambda i: cart.removeProduct(FIRST_ID + size + i), repeat))
+
+
+def bench_totals(sizes):  # running totals against a full recompute, which is what a summary used to cost
+    print("Cart totals:")
+    for size in sizes:
+        cart = make_cart(size)
+        report("totals", size, time_per_op(lambda i: cart.totals(), 1000))
+        report("recomputeTotals", size, time_per_op(lambda i: cart.recomputeTotals(), max(1, 10000 // size)))
+        with redirect_stdout(io.StringIO()):  # time building the summary, not the terminal
+            seconds = time_per_op(lambda i: cart.getContents(), max(1, 1000 // size))
+        report("getContents", size, seconds)
+        if cart.totals() != cart.recomputeTotals():
+            raise AssertionError("running totals do not match a full recompute")
+
+
+def bench_products(sizes):  # building Clothing, Food and Toys objects and turning them into JSON dicts
+    print("Products:")
+    expiry_date = datetime(2099, 1, 1)
+    kinds = [("Clothing", lambda i: Clothing("Shirt", 9.99, 1, "Brand", FIRST_ID + i, "M", "Cotton")),
+             ("Food", lambda i: Food("Bread", 1.25, 1, "Brand", FIRST_ID + i, expiry_date, True, False)),
+             ("Toys", lambda i: Toys("Ball", 15.5, 1, "Brand", FIRST_ID + i, 3, "M"))]
+    for size in sizes:
+        for name, build in kinds:
+            report(name + "()", size, time_per_op(build, size))
+        products = make_products(size)
+        report("to_json", size, time_per_op(lambda i: products[i].to_json(), size))
+
+
+class DictClothing(Clothing):  # a subclass without __slots__ gets a __dict__, like the products used to
+    pass
+
+
+def measure_memory(build):  # bytes still allocated by whatever build() returns
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+def build_table(n):
+    table = ProductTable()
+    for i in range(n):
+        table.add(Clothing, "Shirt {}".format(i % 1000), 9.99, 1, "Brand", FIRST_ID + i, "M", "Cotton")
+    return table
+
+
+def bench_memory(sizes):  # bytes per row for __dict__ products, __slots__ products and a ProductTable
+    print("Product memory:")
+    for size in sizes:
+        builds = [("__dict__ products", lambda: [DictClothing("Shirt {}".format(i % 1000), 9.99, 1, "Brand",
+                                                              FIRST_ID + i, "M", "Cotton") for i in range(size)]),
+                  ("__slots__ products", lambda: make_clothing(size)),
+                  ("ProductTable", lambda: build_table(size))]
+        for name, build in builds:
+            used = measure_memory(build)
+            print("\t{:<28} {:>8} rows  {:>10.1f} bytes/row".format(name, size, used / size))
+
+
+def bench_export(sizes):  # first and repeated exports, per line, and peak memory while writing
+    print("Cart export:")
+    folder = tempfile.mkdtemp()
+    for size in sizes:
+        cart = make_cart(size)
+        for format in ("json", "ndjson"):
+            path = os.path.join(folder, "cart." + format)
+            for label in ("first", "repeat"):  # the repeat export reuses the bytes cached on each product
+                seconds = time_per_op(lambda i: export_cart(cart, path, format=format), 1)
+                report("export_cart {} {}".format(format, label), size, seconds / size)
+            tracemalloc.start()
+            export_cart(cart, path, format=format)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("\t{:<28} {:>8} lines  {:>10.1f} KiB peak".format("export_cart " + format, size, peak / 1024))
+            os.remove(path)
+            for p in cart.getProducts():  # so the next format starts from cold again
+                p._export = None
+    os.rmdir(folder)
+
+
+def bench_import(sizes):  # bulk loading of files written by export_cart
+    print("Cart import:")
+    folder = tempfile.mkdtemp()
+    for size in sizes:
+        cart = make_cart(size)
+        for format in ("ndjson", "json"):
+            path = os.path.join(folder, "cart." + format)
+            export_cart(cart, path, format=format)
+            seconds = time_per_op(lambda i: load_cart(path), 1)
+            print("\t{:<28} {:>8} lines  {:>10.3f} us/line  {:>8.2f} s total".format(
+                "load_cart " + format, size, seconds / size * 1e6, seconds))
+            record("load_cart " + format, size, seconds / size)
+            os.remove(path)
+    os.rmdir(folder)
+
+
+def bench_validation(sizes):  # column validators over whole columns of raw CSV-like strings
+    print("Batch validation:")
+    for size in sizes:
+        columns = [("validate_prices", validate_prices, ["9.99"] * size),
+                   ("validate_quantities", validate_quantities, ["2"] * size),
+                   ("validate_ids", validate_ids, [str(FIRST_ID + i) for i in range(size)]),
+                   ("validate_sizes", validate_sizes, ["m"] * size),
+                   ("validate_expiry_dates", validate_expiry_dates, ["01/01/2099"] * size)]
+        for name, check, values in columns:
+            report(name, size, time_per_op(lambda i: check(values), 1) / size)
+
+
+async def _client(port, requests, latencies):  # one simulated customer sending requests one after another
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    await reader.readline()  # greeting
+    for request in requests:
+        start = time.perf_counter()
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        await reader.readline()
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+def _session_requests(i):  # add a product, change its quantity, look at the cart, then finish
+    unique_id = FIRST_ID + i
+    product = {"type": "Clothing", "name": "Shirt", "price": 9.99, "quantity": 1, "brand": "Brand",
+               "unique id": unique_id, "size": "M", "materials": "Cotton"}
+    return [{"cmd": "A", "products": [product]}, {"cmd": "Q", "id": unique_id, "quantity": 2}, {"cmd": "S"},
+            {"cmd": "R", "id": unique_id}, {"cmd": "S"}, {"cmd": "T"}]
+
+
+async def _load_test(clients):
+    server = CartServer()
+    port = await server.start(port=0)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(port, _session_requests(i), latencies) for i in range(clients)])
+    seconds = time.perf_counter() - start
+    await server.close()
+    return latencies, seconds
+
+
+def bench_server(sizes):  # concurrent sessions against a local cart server, capped by how many sockets we may open
+    print("Cart server:")
+    for clients in [s for s in sizes if s <= 1000]:
+        latencies, seconds = asyncio.run(_load_test(clients))
+        latencies.sort()
+        print("\t{:>6} sessions  {:>8.0f} requests/s  p50 {:>8.3f} ms  p99 {:>8.3f} ms".format(
+            clients, len(latencies) / seconds, latencies[len(latencies) // 2] * 1e3,
+            latencies[int(len(latencies) * 0.99)] * 1e3))
+
+
+def bench_journal(sizes):  # journalled writes, recovery by replaying the journal, and recovery from a snapshot
+    print("Cart journal:")
+    for size in sizes:
+        folder = tempfile.mkdtemp()
+        cart = PersistentCart(folder, snapshot_every=size + 1)
+        products = make_clothing(size)
+        report("journalled addProduct", size, time_per_op(lambda i: cart.addProduct(products[i]), size))
+        cart.close()
+
+        start = time.perf_counter()
+        cart = PersistentCart(folder)
+        seconds = time.perf_counter() - start
+        print("\t{:<28} {:>8} lines  {:>10.0f} records/s".format("journal replay", size, size / seconds))
+        cart.checkpoint()
+        cart.close()
+        start = time.perf_counter()
+        cart = PersistentCart(folder)
+        seconds = time.perf_counter() - start
+        print("\t{:<28} {:>8} lines  {:>10.0f} records/s".format("snapshot recovery", size, size / seconds))
+
+        cart.changeProductQuantity(FIRST_ID, 5)
+        cart.close()
+        with open(os.path.join(folder, "journal-000002.log"), "ab") as f:  # a record torn by a crash
+            f.write(b"\x03\x10\x00")
+        cart = PersistentCart(folder)
+        if cart.checkListLength() != size or cart.getProduct(FIRST_ID).quantity != 5:
+            raise AssertionError("cart was not recovered after a torn journal write")
+        cart.close()
+        shutil.rmtree(folder)
+
+
+def bench_binary(sizes):  # opening a binary cart with mmap against loading the same cart from JSON
+    print("Binary cart:")
+    folder = tempfile.mkdtemp()
+    binary_path = os.path.join(folder, "cart.bin")
+    json_path = os.path.join(folder, "cart.json")
+    for size in sizes:
+        cart = ShoppingCart(make_products(size))
+        write_binary_cart(cart, binary_path)
+        export_cart(cart, json_path)
+        with BinaryCart(binary_path) as binary:  # the round trip must give back the same products and totals
+            if [p.to_json() for p in binary.products()] != [p.to_json() for p in cart.getProducts()] or \
+                    binary.totals() != cart.totals():
+                raise AssertionError("binary cart does not round trip")
+
+        def open_binary(i):
+            with BinaryCart(binary_path) as binary:
+                binary.totals()
+                binary.find(FIRST_ID + size // 2)
+        report("open + totals binary", size, time_per_op(open_binary, 3))
+        report("load_cart + totals json", size, time_per_op(lambda i: load_cart(json_path).cart.totals(), 1))
+        with BinaryCart(binary_path) as binary:
+            report("select binary", size, time_per_op(
+                lambda i: binary.select(kind=Food, gluten_free=True, brand="Brand 4"), 3))
+    shutil.rmtree(folder)
+
+
+def make_rules():  # a typical set of promotions
+    return [MultiBuy(3, 2, kind=Toys), Discount(10, brand="Brand 3"), Discount(5, kind=Food),
+            Discount(15, kind=Clothing, brand="Brand 7")]
+
+
+def bench_pricing(sizes):  # pricing a whole cart, against repricing after a single quantity change
+    print("Pricing:")
+    for size in [s for s in sizes if s <= 100000]:
+        cart = ShoppingCart(make_products(size))
+        engine = PricingEngine(make_rules())
+        report("price_cart cold", size, time_per_op(lambda i: engine.set_rules(make_rules()) or
+                                                    engine.price_cart(cart), 1))
+        report("price_cart cached", size, time_per_op(lambda i: engine.price_cart(cart), 3))
+        pricing = CartPricing(cart, engine)
+        pricing.totals()
+        report("quantity change + totals", size, time_per_op(
+            lambda i: cart.changeProductQuantity(FIRST_ID + i % size, 1 + i % 7) or pricing.totals(), 1000))
+        if pricing.totals() != engine.price_cart(cart)[1]:
+            raise AssertionError("incremental pricing does not match pricing the whole cart")
+
+
+def bench_batch_checkout(sizes):  # many small exported carts checked out in-process and over process pools
+    print("Batch checkout:")
+    lines_per_cart = 20
+    for size in [s for s in sizes if 100 <= s <= 100000]:
+        carts = []
+        for c in range(size // lines_per_cart):
+            cart = ShoppingCart(make_products(lines_per_cart, start=c * lines_per_cart))
+            carts.append((c, b"".join(iter_export(cart))))
+        engine = PricingEngine(make_rules())
+        start = time.perf_counter()
+        for cart_id, data in carts:
+            checkout_cart(cart_id, data, engine=engine)
+        seconds = time.perf_counter() - start
+        print("\t{:<20} {:>8} carts  {:>10.0f} carts/s".format("in process", len(carts), len(carts) / seconds))
+        workers = 1
+        while workers <= (os.cpu_count() or 1):
+            start = time.perf_counter()
+            summary = summarise_batch(run_batch_checkout(carts, workers=workers, rules=make_rules()), start)
+            print("\t{:<20} {:>8} carts  {:>10.0f} carts/s".format(
+                "{} worker(s)".format(workers), summary.carts, summary.carts_per_second))
+            workers = workers * 2
+
+
+def make_food(n, start=0):  # food lines expiring on a spread of days from 2090 onwards
+    first_day = datetime(2090, 1, 1)
+    return [Food("Food {}".format(i % 1000), 1.25, 1, "Farm", FIRST_ID + i, first_day + timedelta(days=i % 3650),
+                 True, False) for i in range(start, start + n)]
+
+
+def bench_expiry(sizes):  # inserting into, removing from and querying the expiry index
+    print("Expiry index:")
+    for size in sizes:
+        cart = ShoppingCart(make_food(size))
+        index = ExpiryIndex(cart)
+        repeat = min(size, 1000)
+        extra = make_food(repeat, start=size)
+        report("addProduct with index", size, time_per_op(lambda i: cart.addProduct(extra[i]), repeat))
+        report("removeProduct with index", size, time_per_op(lambda i: cart.removeProduct(FIRST_ID + size + i),
+                                                             repeat))
+        report("expiring_before (2 days)", size, time_per_op(
+            lambda i: index.expiring_before(datetime(2090, 1, 3)), repeat))
+        report("purge_expired (10 days)", size, time_per_op(
+            lambda i: index.purge_expired(today=datetime(2090, 1, 11)), 1))
+
+
+def bench_query(sizes):  # indexed queries against filtering the cart with a loop
+    print("Cart query:")
+    for size in sizes:
+        cart = ShoppingCart(make_products(size))
+        cart.query()  # build the indexes
+        report("query brand+vegan", size, time_per_op(
+            lambda i: cart.query(brand="Brand 1", suitable_for_vegans=True), 20))
+        report("query age range", size, time_per_op(lambda i: cart.query(type="Toys", minimum_age__lte=4), 20))
+        report("scan brand+vegan", size, time_per_op(
+            lambda i: [p for p in cart.getProducts() if p.brand == "Brand 1" and
+                       getattr(p, "suitable_for_vegans", None) is True], 3))
+        report("indexed addProduct", size, time_per_op(
+            lambda i: cart.addProduct(Toys("Extra", 1.0, 1, "Brand 1", FIRST_ID + size + i, 3, "M")), 1000))
+
+
+def bench_commands(sizes):  # a command file with one add per product, run in bulk and one command at a time
+    print("Command file:")
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "commands.ndjson")
+    for size in sizes:
+        records = [product_record(p) for p in make_products(size)]
+        with open(path, "w") as f:
+            for record in records:
+                f.write(json.dumps({"cmd": "add", "products": [record]}) + "\n")
+            f.write(json.dumps({"cmd": "S"}) + "\n")
+        seconds = time_per_op(lambda i: run_command_file(path), 1)
+        report("run_command_file", size, seconds / size)
+        cart = ShoppingCart()
+        seconds = time_per_op(lambda i: execute(cart, {"cmd": "add", "products": [records[i]]}), size)
+        report("execute one add at a time", size, seconds)
+    os.remove(path)
+    os.rmdir(folder)
+
+
+def bench_instrumentation(sizes):  # cart operations with instrumentation off and on
+    print("Instrumentation:")
+    for size in sizes:
+        products = make_clothing(size)
+        for label in ("off", "on"):
+            cart = ShoppingCart()
+            if label == "off":
+                seconds = time_per_op(lambda i: cart.addProduct(products[i]), size)
+            else:
+                with instrumented(Metrics()):
+                    seconds = time_per_op(lambda i: cart.addProduct(products[i]), size)
+            report("addProduct instrumented " + label, size, seconds)
+
+
+def bench_merge(sizes):  # adding repeated products (1000 distinct variants) to a plain cart and a merging one
+    print("Line merging:")
+    for size in sizes:
+        for merge_key in (None, "variant"):
+            products = make_clothing(size)  # 1000 distinct names, so at most 1000 merged lines
+            cart = ShoppingCart(merge_key=merge_key)
+            seconds = time_per_op(lambda i: cart.addMany(products), 1) / size
+            report("addMany " + (merge_key or "plain"), size, seconds)
+            report("recomputeTotals " + (merge_key or "plain"), cart.number_of_products,
+                   time_per_op(lambda i: cart.recomputeTotals(), 1))
+
+
+def bench_snapshot(sizes):  # taking snapshots against copying the cart, and diffing after 100 changes
+    print("Cart snapshots:")
+    for size in sizes:
+        cart = ShoppingCart(make_products(size))
+        report("snapshot", size, time_per_op(lambda i: cart.snapshot().close(), 1000))
+        report("copy of cart_list", size, time_per_op(lambda i: [copy.copy(p) for p in cart.getProducts()], 1))
+        repeat = min(size, 1000)
+        report("changeProductQuantity, no snapshot", size, time_per_op(
+            lambda i: cart.changeProductQuantity(FIRST_ID + i, 3), repeat))
+        before = cart.snapshot()
+        report("changeProductQuantity, 1 snapshot open", size, time_per_op(
+            lambda i: cart.changeProductQuantity(FIRST_ID + i, 4), repeat))
+        for i in range(100):
+            cart.changeProductQuantity(FIRST_ID + size - 1 - i, 5)
+        report("diff after 100 changes", size, time_per_op(lambda i: diff(before, cart), 10))
+        report("restore", size, time_per_op(lambda i: cart.restore(before), 1))
+
+
+def _registry_work(registry, customers, requests, seed):  # a skewed mix where a few customers are most active
+    rng = random.Random(seed)
+    for i in range(requests):
+        customer_id = int(customers * rng.random() ** 3)
+        with registry.using(customer_id) as cart:
+            cart.totals()
+
+
+def _use_cart(registry, customer_id):  # fault a customer's cart in, doing nothing with it
+    with registry.using(customer_id):
+        pass
+
+
+def bench_registry(sizes):  # customers with 10 line carts, a hot set of a tenth of them and the rest on disk
+    print("Cart registry:")
+    for customers in [s for s in sizes if s <= 100000]:  # every customer's cart is written to disk once
+        folder = tempfile.mkdtemp()
+        registry = CartRegistry(folder, max_carts=max(16, customers // 10))
+        for c in range(customers):
+            with registry.using(c) as cart:
+                cart.addMany(make_products(10, start=c * 10))
+        report("using hot", customers, time_per_op(
+            lambda i: _use_cart(registry, customers - 1 - i % min(16, customers)), 1000))
+        report("using cold (load from disk)", customers, time_per_op(
+            lambda i: _use_cart(registry, i * 7919 % customers), 200))
+        threads = [threading.Thread(target=_registry_work, args=(registry, customers, 2000, t)) for t in range(4)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        report("using, 4 threads skewed", customers, (time.perf_counter() - start) / 8000)
+        stats = registry.stats()
+        print("\t{:>8} customers  hit rate {:.2f}  {} evictions  {} hot carts  {} hot lines".format(
+            customers, stats["hit_rate"], stats["evictions"], stats["hot_carts"], stats["hot_lines"]))
+        registry.close()
+        shutil.rmtree(folder)
+
+
+BENCHMARKS = {"cart_index": bench_cart_index, "totals": bench_totals, "products": bench_products,
+              "memory": bench_memory,
+              "export": bench_export, "import": bench_import, "validation": bench_validation,
+              "server": bench_server, "journal": bench_journal,
+              "binary": bench_binary, "pricing": bench_pricing,
+              "batch_checkout": bench_batch_checkout, "expiry": bench_expiry,
+              "query": bench_query, "commands": bench_commands,
+              "instrumentation": bench_instrumentation, "merge": bench_merge,
+              "snapshot": bench_snapshot, "registry": bench_registry}
+
+
+def _option(argv, flag, default=None):  # the value following flag in argv
+    return argv[argv.index(flag) + 1] if flag in argv else default
+
+
+def compare(results, baseline, threshold):  # the results which are slower than the baseline by more than threshold
+    before = {(b["name"], b["size"]): b["us_per_op"] for b in baseline}
+    slower = []
+    for result in results:
+        old = before.get((result["name"], result["size"]))
+        if old and result["us_per_op"] > old * (1 + threshold):
+            slower.append((result, old))
+    return slower
+
+
+def main(argv):
+    options = ("--max-size", "--json", "--baseline", "--threshold", "--save-baseline")
+    names = [a for i, a in enumerate(argv) if not a.startswith("--") and (i == 0 or argv[i - 1] not in options)]
+    sizes = SIZES
+    if "--max-size" in argv:  # allow quick runs on smaller carts
+        max_size = int(_option(argv, "--max-size"))
+        sizes = [s for s in SIZES if s <= max_size]
+    for name in names or BENCHMARKS:
+        for benchmark in (CORE if name == "core" else [name]):
+            BENCHMARKS[benchmark](sizes)
+
+    if "--json" in argv:
+        with open(_option(argv, "--json"), "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": RESULTS}, f, indent=1)
+    if "--save-baseline" in argv:
+        with open(_option(argv, "--save-baseline"), "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": RESULTS}, f, indent=1)
+    if "--baseline" in argv:
+        threshold = float(_option(argv, "--threshold", DEFAULT_THRESHOLD))
+        with open(_option(argv, "--baseline")) as f:
+            baseline = json.load(f)["results"]
+        slower = compare(RESULTS, baseline, threshold)
+        for result, old in slower:
+            print("REGRESSION {} at {} lines: {:.3f} us/op against {:.3f} us/op in the baseline".format(
+                result["name"], result["size"], result["us_per_op"], old))
+        if slower:
+            return 1
+        print("No regressions beyond {:.0%} of the baseline".format(threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
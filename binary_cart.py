@@ -0,0 +1,271 @@
+# imports
+import mmap
+import os
+import struct
+from datetime import datetime
+from decimal import Decimal, ROUND_FLOOR
+from operator import mul
+
+from cart_export import temp_file, replace_file
+from main import Clothing, Food, Toys, VALID_SIZES, VALID_GENDERS, to_money
+
+try:  # NumPy is optional, it lets totals and filters work on whole columns of the mapped file at once
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+A fixed-width binary file format for carts which is read through mmap, so a cart can be opened without
+parsing or creating an object per line. Totals, id lookups and filters work straight on the mapped
+bytes, and a line only becomes a Clothing, Food or Toys object when product() is asked for it.
+
+File layout (little endian):
+    header        magic, version, number of lines, offsets of the id index and the string table
+    records       one 64 byte record per line, in cart order
+    id index      (unique id, line) pairs sorted by id, searched with a binary search
+    string table  UTF-8 names, brands and materials, each distinct string stored once
+Prices are stored as whole millionths of a pound so totals are exact.
+"""
+
+MAGIC = b"CART"
+VERSION = 1
+PRICE_SCALE = 10 ** 6
+LARGEST_INT64 = 2 ** 63 - 1
+
+HEADER = struct.Struct("<4sHxxQQQ")  # magic, version, line count, id index offset, string table offset
+# kind, flags, size or gender code, minimum age, quantity, unique id, price in millionths, expiry date
+# ordinal, then (offset, length) in the string table of the name, brand and materials
+RECORD = struct.Struct("<BBBxIqqqi4xIIIIII")
+INDEX_ENTRY = struct.Struct("<qq")  # unique id, line
+
+KINDS = (Clothing, Food, Toys)
+GLUTEN_FREE = 1
+SUITABLE_FOR_VEGANS = 2
+GENDERS = [g.title() for g in VALID_GENDERS]
+
+if np is not None:  # the same record layout as a NumPy dtype, for reading whole columns
+    RECORD_DTYPE = np.dtype([("kind", "u1"), ("flags", "u1"), ("code", "u1"), ("pad", "u1"),
+                             ("minimum_age", "<u4"), ("quantity", "<i8"), ("unique_id", "<i8"),
+                             ("price", "<i8"), ("expiry", "<i4"), ("pad2", "<i4"),
+                             ("name_offset", "<u4"), ("name_length", "<u4"), ("brand_offset", "<u4"),
+                             ("brand_length", "<u4"), ("materials_offset", "<u4"), ("materials_length", "<u4")])
+
+
+def _price_units(price):  # the price as a whole number of millionths
+    units = to_money(price) * PRICE_SCALE
+    if units != units.to_integral_value():
+        raise ValueError("price {} has more than 6 decimal places".format(price))
+    return int(units)
+
+
+def _bound_units(price):  # a filter's maximum price in millionths, rounded down as stored prices are whole
+    units = int((to_money(price) * PRICE_SCALE).to_integral_value(rounding=ROUND_FLOOR))
+    return max(-LARGEST_INT64, min(units, LARGEST_INT64))  # within the range of the price column
+
+
+class _StringTable:  # collects the strings of a cart, storing each distinct one once
+    def __init__(self):
+        self.data = bytearray()
+        self._offsets = {}
+
+    def add(self, text):
+        if text not in self._offsets:
+            encoded = text.encode("utf-8")
+            self._offsets[text] = (len(self.data), len(encoded))
+            self.data.extend(encoded)
+        return self._offsets[text]
+
+
+def _pack_product(p, strings):
+    kind = KINDS.index(type(p))
+    flags = code = minimum_age = expiry = 0
+    materials = (0, 0)
+    if kind == 0:
+        code = VALID_SIZES.index(p.size)
+        materials = strings.add(p.materials)
+    elif kind == 1:
+        flags = (GLUTEN_FREE if p.gluten_free else 0) | (SUITABLE_FOR_VEGANS if p.suitable_for_vegans else 0)
+        expiry = p.expiry_date.toordinal()
+    else:
+        code = GENDERS.index(p.gender.title())
+        minimum_age = p.minimum_age
+    return RECORD.pack(kind, flags, code, minimum_age, p.quantity, p.unique_id, _price_units(p.price), expiry,
+                       *strings.add(p.name), *strings.add(p.brand), *materials)
+
+
+"""
+write_binary_cart function will write cart to path in the binary format, through a temporary file
+which then replaces path so readers never see a half written file
+"""
+
+
+def write_binary_cart(cart, path):
+    strings = _StringTable()
+    ids = []
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = temp_file(folder, ".binary-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(bytes(HEADER.size))  # filled in once the offsets are known
+            for line, p in enumerate(cart.getProducts()):
+                f.write(_pack_product(p, strings))
+                ids.append((p.unique_id, line))
+            index_offset = f.tell()
+            ids.sort()
+            f.write(b"".join(INDEX_ENTRY.pack(unique_id, line) for unique_id, line in ids))
+            strings_offset = f.tell()
+            f.write(strings.data)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, len(ids), index_offset, strings_offset))
+            f.flush()
+            os.fsync(f.fileno())
+        replace_file(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _largest(column):  # the largest absolute value in a NumPy column of ints, at least 1, as a Python int
+    if not len(column):
+        return 1
+    return max(-int(column.min()), int(column.max()), 1)
+
+
+# a cart file opened through mmap, read in place
+class BinaryCart:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count, self._index_offset, self._strings_offset = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError("{} is not a version {} binary cart".format(path, VERSION))
+        self._records = None
+        if np is not None:  # a view of the records as columns, no data is copied
+            self._records = np.frombuffer(self._map, dtype=RECORD_DTYPE, count=self._count, offset=HEADER.size)
+
+    def close(self):
+        self._records = None  # the NumPy view has to go before the map can close
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def _record(self, line):
+        return RECORD.unpack_from(self._map, HEADER.size + line * RECORD.size)
+
+    def _iter_records(self):
+        end = HEADER.size + self._count * RECORD.size
+        return RECORD.iter_unpack(memoryview(self._map)[HEADER.size:end])
+
+    def _string(self, offset, length):
+        start = self._strings_offset + offset
+        return self._map[start:start + length].decode("utf-8")
+
+    """
+    totals method will return the same totals as ShoppingCart.totals, worked out from the mapped records
+    """
+
+    def totals(self):
+        if self._records is not None:
+            quantities = self._records["quantity"]
+            prices = self._records["price"]
+            if self._count * _largest(quantities) * _largest(prices) <= LARGEST_INT64:
+                units = int(quantities.sum())
+                price_units = int((quantities * prices).sum())
+            else:  # the int64 columns could overflow, so sum as Python ints which cannot
+                units = sum(quantities.tolist())
+                price_units = sum(map(mul, quantities.tolist(), prices.tolist()))
+        else:
+            units = price_units = 0
+            for record in self._iter_records():
+                units = units + record[4]
+                price_units = price_units + record[4] * record[6]
+        return {"lines": self._count, "units": units, "subtotal": Decimal(price_units) / PRICE_SCALE}
+
+    def find(self, unique_id):  # the line holding unique_id, or None, by binary search of the id index
+        low = 0
+        high = self._count
+        while low < high:
+            middle = (low + high) // 2
+            found, line = INDEX_ENTRY.unpack_from(self._map, self._index_offset + middle * INDEX_ENTRY.size)
+            if found == unique_id:
+                return line
+            if found < unique_id:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def product(self, line):  # build the Clothing, Food or Toys object of a line
+        (kind, flags, code, minimum_age, quantity, unique_id, price, expiry, name_offset, name_length,
+         brand_offset, brand_length, materials_offset, materials_length) = self._record(line)
+        standard = (self._string(name_offset, name_length), price / PRICE_SCALE, quantity,
+                    self._string(brand_offset, brand_length), unique_id)
+        if kind == 0:
+            return Clothing(*standard, VALID_SIZES[code], self._string(materials_offset, materials_length))
+        if kind == 1:
+            return Food(*standard, datetime.fromordinal(expiry), bool(flags & GLUTEN_FREE),
+                        bool(flags & SUITABLE_FOR_VEGANS))
+        return Toys(*standard, minimum_age, GENDERS[code])
+
+    def products(self):
+        for line in range(self._count):
+            yield self.product(line)
+
+    """
+    select method will return the lines matching every filter given: the product kind (Clothing, Food or
+    Toys), brand, gluten_free, suitable_for_vegans and a maximum price
+    """
+
+    def select(self, kind=None, brand=None, gluten_free=None, suitable_for_vegans=None, max_price=None):
+        kind = KINDS.index(kind) if kind is not None else None
+        encoded_brand = brand.encode("utf-8") if brand is not None else None
+        max_units = _bound_units(max_price) if max_price is not None else None
+        if self._records is not None:
+            return self._select_columns(kind, encoded_brand, gluten_free, suitable_for_vegans, max_units)
+        lines = []
+        for line, record in enumerate(self._iter_records()):
+            if kind is not None and record[0] != kind:
+                continue
+            if gluten_free is not None and (record[0] != 1 or bool(record[1] & GLUTEN_FREE) != gluten_free):
+                continue
+            if suitable_for_vegans is not None and \
+                    (record[0] != 1 or bool(record[1] & SUITABLE_FOR_VEGANS) != suitable_for_vegans):
+                continue
+            if max_units is not None and record[6] > max_units:
+                continue
+            if encoded_brand is not None and not self._string_equals(record[10], record[11], encoded_brand):
+                continue
+            lines.append(line)
+        return lines
+
+    def _select_columns(self, kind, encoded_brand, gluten_free, suitable_for_vegans, max_units):
+        records = self._records
+        mask = np.ones(self._count, dtype=bool)
+        if kind is not None:
+            mask &= records["kind"] == kind
+        if gluten_free is not None:
+            mask &= (records["kind"] == 1) & (((records["flags"] & GLUTEN_FREE) != 0) == gluten_free)
+        if suitable_for_vegans is not None:
+            mask &= (records["kind"] == 1) & (((records["flags"] & SUITABLE_FOR_VEGANS) != 0) == suitable_for_vegans)
+        if max_units is not None:
+            mask &= records["price"] <= max_units
+        lines = np.nonzero(mask)[0]
+        if encoded_brand is not None:  # equal strings share one offset, so only distinct offsets need checking
+            lines = lines[records["brand_length"][lines] == len(encoded_brand)]
+            offsets = records["brand_offset"][lines]
+            matching = [o for o in np.unique(offsets).tolist()
+                        if self._string_equals(o, len(encoded_brand), encoded_brand)]
+            lines = lines[np.isin(offsets, matching)]
+        return lines.tolist()
+
+    def _string_equals(self, offset, length, encoded):
+        start = self._strings_offset + offset
+        return length == len(encoded) and self._map[start:start + length] == encoded
@@ -0,0 +1,127 @@
+# imports
+import io
+import json
+import os
+from operator import attrgetter
+
+"""
+Streaming export of a ShoppingCart. Products are encoded one at a time by a generator and written
+through a buffered file, so memory use does not grow with the size of the cart. When exporting to a
+path the data is written to a temporary file in the same folder which then replaces the target, so a
+reader never sees a half written export.
+Every product becomes one JSON object: its to_json() fields plus its "type" and "name".
+
+The UTF-8 encoded JSON of each product is cached on the product together with the values of the fields
+it was made from. Exporting a product again only checks that none of its fields has changed, through
+changeProductQuantity or otherwise, and reuses the bytes, so exporting the same cart again is mostly
+joining bytes which are already made.
+"""
+
+EXPORT_FORMATS = ("json", "ndjson")  # a JSON array of products, or one product per line
+BUFFER_SIZE = 1 << 16
+BATCH_SIZE = 1024  # products joined into one chunk before it is written
+
+_encoder = json.JSONEncoder(ensure_ascii=False)
+_field_getters = {}  # product class -> function returning the values of every field of a product
+
+
+def product_record(item):  # the exported dict for a single product
+    record = {"type": type(item).__name__, "name": item.name}
+    record.update(item.to_json())
+    return record
+
+
+def _fields(item):
+    kind = type(item)
+    getter = _field_getters.get(kind)
+    if getter is None:
+        getter = _field_getters[kind] = attrgetter("name", "price", "quantity", "unique_id", "brand",
+                                                   *kind.__slots__)
+    return getter(item)
+
+
+def product_bytes(item):  # the UTF-8 JSON of a single product, from its cache unless a field has changed
+    fields = _fields(item)
+    cached = getattr(item, "_export", None)
+    if cached is not None and cached[0] == fields:
+        return cached[1]
+    encoded = _encoder.encode(product_record(item)).encode("utf-8")
+    item._export = (fields, encoded)
+    return encoded
+
+
+"""
+iter_export function will yield the export of the cart as chunks of UTF-8 encoded bytes, each holding
+up to BATCH_SIZE products
+"""
+
+
+def iter_export(cart, format="json"):
+    if format not in EXPORT_FORMATS:
+        raise ValueError("Unknown export format {}, expected one of {}".format(format, ", ".join(EXPORT_FORMATS)))
+    separator = b"\n" if format == "ndjson" else b",\n"
+    batch = []
+    first = True
+    for item in cart.getProducts():
+        batch.append(product_bytes(item))
+        if len(batch) == BATCH_SIZE:
+            yield _chunk(batch, separator, format, first)
+            batch = []
+            first = False
+    if batch or first:
+        yield _chunk(batch, separator, format, first)
+    if format == "json":
+        yield b"]\n"
+
+
+def _chunk(batch, separator, format, first):
+    if format == "ndjson":
+        return separator.join(batch) + b"\n" if batch else b""
+    return (b"[" if first else separator) + separator.join(batch)
+
+
+# a new temporary file in folder, open for writing, as (fd, path). Unlike tempfile.mkstemp, which makes
+# files 0600, it is made like open() makes files: 0666 less the umask, which the kernel applies
+def temp_file(folder, prefix):
+    while True:
+        temp_path = os.path.join(folder, "{}{}.tmp".format(prefix, os.urandom(8).hex()))
+        try:
+            return os.open(temp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0),
+                           0o666), temp_path
+        except FileExistsError:  # another file took the name, try a new one
+            continue
+
+
+def replace_file(temp_path, path):  # move a finished temp_file over path, keeping the mode of the file replaced
+    try:
+        os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+    except FileNotFoundError:
+        pass  # a new file keeps the mode temp_file gave it
+    os.replace(temp_path, path)
+
+
+"""
+export_cart function will write the cart to fp, which is either a path or an open file.
+Paths are written atomically, open files are simply written to
+"""
+
+
+def export_cart(cart, fp, format="json"):
+    chunks = iter_export(cart, format)
+    if hasattr(fp, "write"):
+        if isinstance(fp, io.TextIOBase):
+            chunks = (chunk.decode("utf-8") for chunk in chunks)
+        fp.writelines(chunks)
+        return
+
+    folder = os.path.dirname(os.path.abspath(fp))
+    fd, temp_path = temp_file(folder, ".export-")
+    try:
+        with os.fdopen(fd, "wb", buffering=BUFFER_SIZE) as f:
+            f.writelines(chunks)
+            f.flush()
+            os.fsync(f.fileno())  # make sure the data is on disk before it replaces the old file
+        replace_file(temp_path, fp)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -0,0 +1,173 @@
+# imports
+import csv
+import gc
+import json
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+
+from main import ShoppingCart, Clothing, Food, Toys
+from validation import (validate_types, validate_text, validate_prices, validate_quantities, validate_ids,
+                        validate_sizes, validate_genders, validate_bools, validate_expiry_dates, combine_masks)
+
+"""
+Non-interactive bulk loading of carts from NDJSON, CSV or a JSON array, the same records export_cart
+writes. Records are streamed in batches, each batch is checked a column at a time by the validation
+module without printing anything, and valid rows are turned into the right product class. Duplicate ids
+are found through the cart's id index instead of a scan of the cart per id.
+Problems are collected as RecordError tuples and returned with the cart.
+"""
+
+BATCH_SIZE = 10000
+
+PRODUCT_CLASSES = {"Clothing": Clothing, "Food": Food, "Toys": Toys}
+
+RecordError = namedtuple("RecordError", ["line", "unique_id", "message"])  # line numbers start at 1
+LoadResult = namedtuple("LoadResult", ["cart", "loaded", "errors"])
+
+
+def read_records(path, format=None):  # yield (line number, record dict) pairs from the file
+    format = format or _format_from_path(path)
+    with open(path, newline="" if format == "csv" else None, encoding="utf-8") as f:
+        if format == "csv":
+            for line, row in enumerate(csv.DictReader(f), start=1):
+                yield line, row
+        elif format == "ndjson":
+            for line, text in enumerate(f, start=1):
+                if text.strip():  # blank lines are allowed between records
+                    try:
+                        yield line, json.loads(text)
+                    except ValueError:
+                        yield line, None
+        elif format == "json":  # a JSON array has to be read whole
+            for line, record in enumerate(json.load(f), start=1):
+                yield line, record
+        else:
+            raise ValueError("Unknown import format {}, expected csv, ndjson or json".format(format))
+
+
+def _format_from_path(path):
+    extension = path.rsplit(".", 1)[-1].lower()
+    return "ndjson" if extension == "jsonl" else extension
+
+
+"""
+load_cart function will load every valid record in path into a cart (a new one unless one is given)
+and return a LoadResult with the cart, the number of products loaded and the list of RecordErrors
+"""
+
+
+def load_cart(path, cart=None, format=None, batch_size=BATCH_SIZE):
+    if cart is None:
+        cart = ShoppingCart()
+    today = datetime.today()  # worked out once for the whole load
+    errors = []
+    records = read_records(path, format)
+    gc_was_enabled = gc.isenabled()
+    gc.disable()  # the new products hold no reference cycles, so skip collections while creating millions of them
+    try:
+        loaded = _load_batches(records, cart, today, batch_size, errors)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    errors.sort(key=lambda e: e.line)
+    return LoadResult(cart, loaded, errors)
+
+
+"""
+add_records function will check a list of record dicts and add the valid ones to cart, returning a
+LoadResult where the line of each error is the position of the record in the list, starting at 1
+"""
+
+
+def add_records(cart, records, today=None):
+    errors = []
+    lines = list(range(1, len(records) + 1))
+    loaded = _load_rows(lines, records, cart, today or datetime.today(), errors) if records else 0
+    errors.sort(key=lambda e: e.line)
+    return LoadResult(cart, loaded, errors)
+
+
+def _load_batches(records, cart, today, batch_size, errors):  # load every batch, returning how many were added
+    loaded = 0
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        lines = []
+        rows = []
+        for line, record in batch:
+            if isinstance(record, dict):
+                lines.append(line)
+                rows.append(record)
+            else:
+                errors.append(RecordError(line, None, "record is not a JSON object"))
+        if rows:
+            loaded = loaded + _load_rows(lines, rows, cart, today, errors)
+    return loaded
+
+
+def _column(rows, field):
+    return [row.get(field) for row in rows]
+
+
+# the extra fields of each product type, in the order its class takes them, with the check for each
+EXTRA_FIELDS = {
+    Clothing: [("size", validate_sizes), ("materials", validate_text)],
+    Food: [("expiry date", validate_expiry_dates), ("gluten free", validate_bools),
+           ("suitable for vegan", validate_bools)],
+    Toys: [("minimum_age", validate_quantities), ("gender", validate_genders)],
+}
+
+
+def _record_errors(result, lines, rows, positions=None):  # turn the FieldErrors of a column into RecordErrors
+    record_errors = []
+    for e in result.errors:
+        i = e.row if positions is None else positions[e.row]
+        record_errors.append(RecordError(lines[i], rows[i].get("unique id"), "{} {}".format(e.field, e.message)))
+    return record_errors
+
+
+def _validate_cart_ids(ids, cart):  # a cart merging on unique id adds repeated and existing ids to their line
+    if cart.mergesIds():
+        return validate_ids(ids, repeats=True)
+    return validate_ids(ids, existing=cart.getIds())
+
+
+def _load_rows(lines, rows, cart, today, errors):  # check a batch of records column by column and add the good ones
+    types = validate_types(_column(rows, "type"))
+    standard = [validate_text(_column(rows, "name"), "name"),
+                validate_prices(_column(rows, "price")),
+                validate_quantities(_column(rows, "quantity")),
+                validate_text(_column(rows, "brand"), "brand"),
+                _validate_cart_ids(_column(rows, "unique id"), cart)]
+    for result in [types] + standard:
+        errors.extend(_record_errors(result, lines, rows))
+    valid = combine_masks([r.mask for r in [types] + standard], len(rows))
+
+    extras = [None] * len(rows)  # the checked extra values of each row, left as None if any of them is bad
+    for product_class, fields in EXTRA_FIELDS.items():
+        positions = [i for i, t in enumerate(types.values) if t == product_class.__name__]
+        if not positions:
+            continue
+        checked = []
+        for field, check in fields:
+            values = [rows[i].get(field) for i in positions]
+            if check is validate_expiry_dates:
+                checked.append(check(values, today, field))
+            else:
+                checked.append(check(values, field))
+            errors.extend(_record_errors(checked[-1], lines, rows, positions))
+        for j, i in enumerate(positions):
+            values = [result.values[j] for result in checked]
+            if all(v is not None for v in values):
+                extras[i] = values
+
+    products = []
+    names, prices, quantities, brands, ids = [r.values for r in standard]
+    for i, good in enumerate(valid):
+        if good and extras[i] is not None:
+            product_class = PRODUCT_CLASSES[types.values[i]]
+            products.append(product_class(names[i], prices[i], quantities[i], brands[i], ids[i], *extras[i]))
+    cart.addMany(products)  # a cart which merges lines adds up repeated products in one pass
+    return len(products)
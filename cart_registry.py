@@ -0,0 +1,220 @@
+# imports
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from cart_store import product_state, product_from_state
+from main import ShoppingCart
+
+"""
+A registry of the carts of many customers. Only a bounded hot set of carts is kept in memory; a cart
+which has not been used for a while is spilled to a SQLite file on local disk and is loaded back the
+next time its customer asks for it, so idle carts do not hold on to memory.
+
+The carts are split over shards by customer id. Each shard has its own lock, its own least recently
+used order and its own SQLite file, so threads working on the carts of different shards do not wait
+for each other. The limits on the number of carts and lines kept in memory are shared equally between
+the shards, so each limit has to be at least the number of shards. A cart is spilled when its shard is
+over either limit (least recently used first) or when it has not been used for ttl seconds, and it is
+only written to disk if it has changed since it was loaded.
+
+Carts are only handed out by `with registry.using(customer_id) as cart`, which keeps the cart in memory
+until the block ends. A cart may be spilled at any time after its block ends, and changes made to it
+after that are lost, so the cart should not be kept or used outside the block.
+"""
+
+DEFAULT_SHARDS = 16
+DEFAULT_MAX_CARTS = 10000
+DEFAULT_MAX_LINES = 1000000
+
+
+class _Entry:  # a cart in memory and what its shard needs to know about it
+    __slots__ = ("cart", "last_used", "dirty", "pins", "lines", "listener")
+
+    def __init__(self, cart, dirty):
+        self.cart = cart
+        self.last_used = time.monotonic()
+        self.dirty = dirty  # changed since it was last written to disk
+        self.pins = 0  # using() blocks currently holding the cart
+        self.lines = cart.number_of_products
+        self.listener = None
+
+
+class _Shard:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # customer id -> _Entry, least recently used first
+        self.lines = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)  # only used while holding lock
+        # write-ahead logging without an fsync per spill: a crash of the process loses nothing, only a power
+        # cut can lose the last carts spilled
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS carts (customer_id TEXT PRIMARY KEY, products BLOB)")
+        self.db.commit()
+
+
+class CartRegistry:
+    def __init__(self, folder, shards=DEFAULT_SHARDS, max_carts=DEFAULT_MAX_CARTS, max_lines=DEFAULT_MAX_LINES,
+                 ttl=None, merge_key=None):
+        if max_carts < shards or max_lines < shards:  # each shard must be allowed at least one cart and line
+            raise ValueError("max_carts and max_lines must be at least the number of shards ({})".format(shards))
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.max_carts_per_shard = max_carts // shards  # rounded down, so the shards never hold more than max_carts
+        self.max_lines_per_shard = max_lines // shards
+        self.ttl = ttl  # seconds a cart may sit unused in memory, None for no limit
+        self.merge_key = merge_key  # passed on to every cart
+        self._shards = [_Shard(os.path.join(folder, "shard-{:03d}.sqlite".format(i))) for i in range(shards)]
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "created": 0, "evictions": 0, "spills": 0}
+
+    def _shard(self, customer_id):
+        # crc32 rather than hash() as it is the same in every process, so a cart is found in the same file
+        return self._shards[zlib.crc32(str(customer_id).encode("utf-8")) % len(self._shards)]
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] = self._stats[name] + 1
+
+    # keep the shard's line count and the entry's dirty flag up to date. The cart is changed without holding
+    # the shard lock, so the line count is only a close estimate while other threads are changing carts
+    def _track(self, shard, entry):
+        def changed(event, p):
+            entry.dirty = True
+            if event != "quantity":
+                difference = 1 if event == "add" else -1
+                entry.lines = entry.lines + difference
+                shard.lines = shard.lines + difference
+        entry.listener = changed
+        entry.cart.addListener(changed)
+
+    def _load(self, shard, customer_id):  # the entry for a cart which is not in memory, from disk or new
+        row = shard.db.execute("SELECT products FROM carts WHERE customer_id = ?", (str(customer_id),)).fetchone()
+        cart = ShoppingCart(merge_key=self.merge_key)
+        if row is None:
+            self._count("created")
+            entry = _Entry(cart, True)
+        else:
+            self._count("misses")
+            cart.addMany([product_from_state(state) for state in pickle.loads(row[0])])
+            entry = _Entry(cart, False)
+        self._track(shard, entry)
+        shard.entries[customer_id] = entry
+        shard.lines = shard.lines + entry.lines
+        return entry
+
+    def _entry(self, shard, customer_id):  # must hold shard.lock
+        entry = shard.entries.get(customer_id)
+        if entry is None:
+            entry = self._load(shard, customer_id)
+        else:
+            self._count("hits")
+            shard.entries.move_to_end(customer_id)
+        entry.last_used = time.monotonic()
+        self._evict(shard, customer_id)
+        return entry
+
+    def _write(self, shard, customer_id, entry):  # save a cart to the shard's SQLite file
+        states = [product_state(p) for p in entry.cart.getProducts()]
+        shard.db.execute("INSERT OR REPLACE INTO carts VALUES (?, ?)",
+                         (str(customer_id), pickle.dumps(states, protocol=pickle.HIGHEST_PROTOCOL)))
+        entry.dirty = False
+
+    def _drop(self, shard, customer_id, entry):  # forget a cart in memory
+        entry.cart.removeListener(entry.listener)
+        del shard.entries[customer_id]
+        shard.lines = shard.lines - entry.lines
+
+    def _spill(self, shard, customer_id, entry):  # write a cart to disk if it has changed and drop it from memory
+        if entry.dirty:
+            self._write(shard, customer_id, entry)
+            shard.db.commit()
+            self._count("spills")
+        self._drop(shard, customer_id, entry)
+        self._count("evictions")
+
+    def _evict(self, shard, keep=None):  # spill carts until the shard is within its limits, least recently used first
+        now = time.monotonic()
+        for i in range(len(shard.entries)):
+            customer_id, entry = next(iter(shard.entries.items()))
+            over = len(shard.entries) > self.max_carts_per_shard or shard.lines > self.max_lines_per_shard
+            expired = self.ttl is not None and now - entry.last_used > self.ttl
+            if not over and not expired:
+                break  # every later cart was used more recently
+            if entry.pins or customer_id == keep:  # in use, so count it as recently used
+                entry.last_used = now
+                shard.entries.move_to_end(customer_id)
+            else:
+                self._spill(shard, customer_id, entry)
+
+    """
+    using method is a context manager giving the cart of a customer, from memory when it is there, loaded
+    from disk when it was spilled, or a new empty cart for a new customer. The cart stays in memory until
+    the with block ends
+    """
+
+    @contextmanager
+    def using(self, customer_id):
+        shard = self._shard(customer_id)
+        with shard.lock:
+            entry = self._entry(shard, customer_id)
+            entry.pins = entry.pins + 1
+        try:
+            yield entry.cart
+        finally:
+            with shard.lock:
+                entry.pins = entry.pins - 1
+                entry.last_used = time.monotonic()
+                if shard.entries.get(customer_id) is entry:  # keep the LRU order in step with last_used
+                    shard.entries.move_to_end(customer_id)
+
+    def remove(self, customer_id):  # forget a customer's cart, in memory and on disk
+        shard = self._shard(customer_id)
+        with shard.lock:
+            entry = shard.entries.get(customer_id)
+            if entry is not None:
+                self._drop(shard, customer_id, entry)
+            shard.db.execute("DELETE FROM carts WHERE customer_id = ?", (str(customer_id),))
+            shard.db.commit()
+
+    def evict_idle(self):  # spill every cart unused for longer than ttl, for calling now and then
+        for shard in self._shards:
+            with shard.lock:
+                self._evict(shard)
+
+    def flush(self, include_pinned=False):  # write changed carts to disk, keeping them in memory
+        for shard in self._shards:
+            with shard.lock:
+                for customer_id, entry in shard.entries.items():
+                    if entry.dirty and (include_pinned or not entry.pins):  # skip carts in the middle of a change
+                        self._write(shard, customer_id, entry)
+                shard.db.commit()
+
+    def close(self):  # spill every cart and close the SQLite files
+        self.flush(include_pinned=True)
+        for shard in self._shards:
+            with shard.lock:
+                for customer_id, entry in list(shard.entries.items()):
+                    self._drop(shard, customer_id, entry)
+                shard.db.close()
+
+    """
+    stats method will return the hits (carts found in memory), misses (carts loaded back from disk),
+    carts created, evictions, spills (evictions which wrote the cart to disk) and the carts and lines
+    currently in memory
+    """
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["hot_carts"] = sum(len(shard.entries) for shard in self._shards)
+        stats["hot_lines"] = sum(shard.lines for shard in self._shards)
+        requests = stats["hits"] + stats["misses"] + stats["created"]
+        stats["hit_rate"] = stats["hits"] / requests if requests else 0.0
+        return stats
@@ -0,0 +1,158 @@
+# imports
+import asyncio
+import itertools
+import json
+import secrets
+import sys
+
+from commands import COMMANDS, command_letter, execute
+from main import ShoppingCart
+
+"""
+An asyncio TCP server giving many clients at once their own shopping cart. Run with:
+    python cart_server.py [host] [port]
+The protocol is one JSON object per line in each direction. Every request has a "cmd" which is one of
+the commands of the interactive program, run by the engine in commands.py (exporting to a file is not
+allowed over the network):
+    {"cmd": "A", "products": [{...}, ...]}     add products, given as records like export_cart writes
+    {"cmd": "R", "id": 1234567890123}          remove a product
+    {"cmd": "S"}                                summary of the cart and its totals
+    {"cmd": "Q", "id": 1234567890123, "quantity": 3}
+    {"cmd": "E"}                                every product in the cart as export records
+    {"cmd": "H"}                                list the supported commands
+    {"cmd": "T"}                                end the session for this connection
+    {"cmd": "J", "token": "..."}               move this connection to the session holding token
+Every reply has "ok", and "error" when ok is false. When a client connects the server sends a greeting
+holding the id of a new session with an empty cart and the session's token, a random secret which is
+only ever sent to the connection which opened the session. J lets several connections share one cart,
+but only a client which has been given the token can join, and a lock per cart keeps their commands
+from interleaving. A session and its cart last until the last connection attached to it sends T or goes
+away, so T from one connection leaves the others sharing the cart as they were.
+Each connection handles one request at a time and waits for its reply to be sent before reading the next
+one, so a slow client only holds up itself, and the number of open sessions is capped.
+"""
+
+DEFAULT_PORT = 8765
+MAX_SESSIONS = 10000
+MAX_LINE = 1 << 20  # the longest request line accepted, in bytes
+BACKLOG = 4096  # connections waiting to be accepted, so bursts of new clients are not dropped
+
+SERVER_COMMANDS = dict(COMMANDS, J="Join an existing session")
+
+
+class CartSession:  # one customer's cart, which one or more connections may be attached to
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.token = secrets.token_urlsafe(24)  # the secret needed to join this session
+        self.cart = ShoppingCart()  # every session gets its own cart
+        self.lock = asyncio.Lock()
+        self.connections = 0
+
+
+def _error(message):
+    return {"ok": False, "error": message}
+
+
+class CartServer:
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.sessions = {}  # token -> CartSession
+        self.max_sessions = max_sessions
+        self._session_ids = itertools.count(1)
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        self._server = await asyncio.start_server(self._serve_client, host, port, limit=MAX_LINE,
+                                                  backlog=BACKLOG)
+        return self._server.sockets[0].getsockname()[1]  # the port, useful when port 0 was asked for
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _new_session(self):  # None when the server already holds as many sessions as it is allowed
+        if len(self.sessions) >= self.max_sessions:
+            return None
+        session = CartSession(next(self._session_ids))
+        self.sessions[session.token] = session
+        session.connections = 1
+        return session
+
+    def _join_session(self, token):
+        session = self.sessions.get(token) if type(token) is str else None
+        if session is not None:
+            session.connections = session.connections + 1
+        return session
+
+    def _leave_session(self, session):
+        session.connections = session.connections - 1
+        if session.connections == 0:  # a cart lives as long as someone is using it
+            self.sessions.pop(session.token, None)
+
+    async def _send(self, writer, reply):
+        writer.write(json.dumps(reply).encode() + b"\n")
+        await writer.drain()  # wait for slow clients rather than buffering replies without limit
+
+    async def _serve_client(self, reader, writer):
+        session = self._new_session()
+        try:
+            if session is None:
+                await self._send(writer, _error("Server busy, try again later"))
+                return
+            await self._send(writer, {"ok": True, "session": session.session_id, "token": session.token})
+
+            while session is not None:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = _decode(line)
+                command = command_letter(request) if request is not None else None
+                if request is None:
+                    reply = _error("Request must be a JSON object on one line")
+                elif command == "J":
+                    joined = self._join_session(request.get("token"))
+                    if joined is None:
+                        reply = _error("Unknown session")
+                    else:
+                        self._leave_session(session)
+                        session = joined
+                        reply = {"ok": True, "session": session.session_id}
+                else:
+                    async with session.lock:  # commands from connections sharing the cart run one at a time
+                        reply = execute(session.cart, request, allow_files=False)
+                    if command == "H":
+                        reply["commands"] = SERVER_COMMANDS
+                    if command == "T":  # only this connection leaves, others may still share the cart
+                        self._leave_session(session)
+                        session = None
+                await self._send(writer, reply)
+        except (ConnectionError, ValueError):
+            pass  # the client went away or sent a line which was too long
+        finally:
+            if session is not None:
+                self._leave_session(session)
+            writer.close()
+
+
+def _decode(line):  # the request dict on a line, or None if it is not one
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return None
+    return request if isinstance(request, dict) else None
+
+
+async def _main(host, port):
+    server = CartServer()
+    port = await server.start(host, port)
+    print("Cart server listening on {}:{}".format(host, port))
+    await server.serve_forever()
+
+
+if __name__ == "__main__":
+    host = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT
+    asyncio.run(_main(host, port))
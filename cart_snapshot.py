@@ -0,0 +1,147 @@
+# imports
+import copy
+from collections import namedtuple
+from operator import attrgetter
+
+"""
+Point in time copies of a ShoppingCart which cost nothing to take. A CartSnapshot made by
+cart.snapshot() shares every line with the cart; only when the cart later changes a line does it hand
+the snapshot the line as it was (copy-on-write), so keeping a snapshot costs memory in proportion to the
+changes made since, not to the size of the cart.
+
+Because a snapshot holds exactly the lines changed since it was taken, diff() of two versions of the
+same cart only looks at those lines rather than at the whole cart.
+"""
+
+CartDiff = namedtuple("CartDiff", ["added", "removed", "quantities"])  # quantities holds (product, old, new)
+
+
+class CartSnapshot:
+    def __init__(self, cart):
+        self.cart = cart
+        self._changed = {}  # unique id -> (product, quantity) as it was when taken, or None if it was not there
+        totals = cart.totals()
+        self._lines = totals["lines"]
+        self._units = totals["units"]
+        self._subtotal = totals["subtotal"]
+
+    def _record(self, unique_id, product):  # called by the cart just before it changes the line unique_id
+        if unique_id not in self._changed:
+            self._changed[unique_id] = (product, product.quantity) if product is not None else None
+
+    def _line(self, unique_id, changed):  # the product as it was, copied only if its quantity has changed since
+        if changed is None:
+            return None
+        product, quantity = changed
+        if product.quantity != quantity:
+            product = copy.copy(product)
+            product.quantity = quantity
+            self._changed[unique_id] = (product, quantity)  # only copy it once
+        return product
+
+    def getProduct(self, unique_id):  # the product with the given unique id when the snapshot was taken, or None
+        if unique_id in self._changed:
+            return self._line(unique_id, self._changed[unique_id])
+        return self.cart.getProduct(unique_id)
+
+    def hasProduct(self, unique_id):
+        if unique_id in self._changed:
+            return self._changed[unique_id] is not None
+        return self.cart.hasProduct(unique_id)
+
+    """
+    getProducts method will yield the products in the snapshot. They come in the order of the cart, and
+    any lines which have been removed from the cart since the snapshot was taken come last
+    """
+
+    def getProducts(self):
+        for p in list(self.cart.getProducts()):  # a copy, so the cart can change while this is read
+            if p.unique_id in self._changed:
+                p = self._line(p.unique_id, self._changed[p.unique_id])
+            if p is not None:
+                yield p
+        for unique_id, changed in list(self._changed.items()):
+            if changed is not None and not self.cart.hasProduct(unique_id):
+                yield self._line(unique_id, changed)
+
+    def getIds(self):
+        return [p.unique_id for p in self.getProducts()]
+
+    @property
+    def cart_list(self):
+        return list(self.getProducts())
+
+    @property
+    def number_of_products(self):
+        return self._lines
+
+    def __len__(self):
+        return self._lines
+
+    def totals(self):  # the totals of the cart when the snapshot was taken
+        return {"lines": self._lines, "units": self._units, "subtotal": self._subtotal}
+
+    def changes(self):  # the number of lines changed in the cart since the snapshot was taken
+        return len(self._changed)
+
+    def close(self):  # stop the cart keeping this snapshot up to date, after which it should not be used
+        self.cart.releaseSnapshot(self)
+
+
+_identity_getters = {}  # product class -> attrgetter of every field but the quantity
+
+
+def _same_product(old, new):  # whether two versions of a line hold the same product, whatever their quantities
+    if old is new:
+        return True
+    kind = type(old)
+    if kind is not type(new):
+        return False
+    getter = _identity_getters.get(kind)
+    if getter is None:
+        getter = _identity_getters[kind] = attrgetter("name", "price", "unique_id", "brand", *kind.__slots__)
+    return getter(old) == getter(new)
+
+
+def _version(v):  # (cart, snapshot) for either a ShoppingCart or a CartSnapshot of one
+    if isinstance(v, CartSnapshot):
+        return v.cart, v
+    return v, None
+
+
+"""
+diff function will return the CartDiff which turns a into b: the products added, the products removed
+and the (product, old quantity, new quantity) of the lines whose quantity changed. A unique id which
+holds a different product in b, as when it was removed and used again, is both removed and added. When
+a and b are versions of the same cart (snapshots of it, or the cart itself) only the lines changed since
+the older of them are compared, otherwise every line is
+"""
+
+
+def diff(a, b):
+    cart_a, snapshot_a = _version(a)
+    cart_b, snapshot_b = _version(b)
+    if cart_a is cart_b and (snapshot_a is not None or snapshot_b is not None):
+        candidates = {}  # a dict used as an ordered set
+        for snapshot in (snapshot_a, snapshot_b):
+            if snapshot is not None:
+                candidates.update(dict.fromkeys(snapshot._changed))
+    else:
+        candidates = dict.fromkeys(a.getIds())
+        candidates.update(dict.fromkeys(b.getIds()))
+    added = []
+    removed = []
+    quantities = []
+    for unique_id in candidates:
+        old = a.getProduct(unique_id)
+        new = b.getProduct(unique_id)
+        if old is None and new is not None:
+            added.append(new)
+        elif old is not None and new is None:
+            removed.append(old)
+        elif old is not None and not _same_product(old, new):
+            removed.append(old)
+            added.append(new)
+        elif old is not None and old.quantity != new.quantity:
+            quantities.append((new, old.quantity, new.quantity))
+    return CartDiff(added, removed, quantities)
@@ -0,0 +1,253 @@
+# imports
+import gc
+import glob
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import zlib
+
+from cart_import import PRODUCT_CLASSES
+from main import ShoppingCart
+
+"""
+Persistence for shopping carts. A PersistentCart is a ShoppingCart which also writes every change to an
+append-only journal in its folder, and every so often (or when checkpoint() is called) writes a binary
+snapshot of the whole cart so recovery only has to replay the journal written since then.
+
+Folder layout:
+    snapshot.bin            the latest snapshot, replaced atomically
+    journal-000001.log      journal segments, a new one is started with every snapshot
+
+Each journal record is a small binary frame: a header with the operation, the payload length and a
+CRC32, then the payload. Records are handed to the operating system as soon as they are written, so a
+crash of the process loses nothing; fsync (which protects against power loss) is batched every
+sync_every records or sync_interval seconds after the first unsynced record, whichever comes first, with
+a timer syncing records which are not followed by others. A record cut short by a crash fails
+its length or CRC check and is dropped, along with anything after it, when the cart is next opened.
+"""
+
+SNAPSHOT_NAME = "snapshot.bin"
+SEGMENT_PATTERN = "journal-{:06d}.log"
+
+OP_ADD = 1
+OP_REMOVE = 2
+OP_QUANTITY = 3
+
+HEADER = struct.Struct("<BII")  # operation, payload length, CRC32 of the payload
+REMOVE = struct.Struct("<q")  # unique id
+QUANTITY = struct.Struct("<qq")  # unique id, new quantity
+
+
+def product_state(p):  # a plain tuple holding everything needed to rebuild the product
+    return (type(p).__name__, p.name, p.price, p.quantity, p.brand, p.unique_id) + \
+        tuple(getattr(p, field) for field in type(p).__slots__)
+
+
+def product_from_state(state):
+    return PRODUCT_CLASSES[state[0]](*state[1:])
+
+
+def _segment_number(path):
+    return int(os.path.basename(path)[len("journal-"):-len(".log")])
+
+
+class CartJournal:  # the files of a PersistentCart: journal segments and the snapshot
+    def __init__(self, folder, sync_every=100, sync_interval=0.05):
+        self.folder = folder
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.records_since_snapshot = 0
+        self._file = None
+        self._segment = 0
+        self._unsynced = 0
+        self._lock = threading.Lock()  # held while writing or syncing, as the sync timer runs in its own thread
+        self._timer = None  # the pending sync of the unsynced records, if any
+        os.makedirs(folder, exist_ok=True)
+
+    def segments(self):  # numbers of the journal segments on disk, oldest first
+        paths = glob.glob(os.path.join(self.folder, "journal-*.log"))
+        return sorted(_segment_number(p) for p in paths)
+
+    def _segment_path(self, number):
+        return os.path.join(self.folder, SEGMENT_PATTERN.format(number))
+
+    """
+    recover method will return the product states of the snapshot and then yield every operation
+    journalled since, as (operation, payload) pairs. A damaged tail of the last segment is cut off
+    """
+
+    def recover(self):
+        states = []
+        first_segment = 1
+        snapshot_path = os.path.join(self.folder, SNAPSHOT_NAME)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+            states = snapshot["products"]
+            first_segment = snapshot["segment"]
+        segments = [n for n in self.segments() if n >= first_segment]
+        self._segment = segments[-1] if segments else first_segment
+        return states, self._replay(segments)
+
+    def _replay(self, segments):
+        for number in segments:
+            path = self._segment_path(number)
+            with open(path, "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset + HEADER.size <= len(data):
+                operation, length, checksum = HEADER.unpack_from(data, offset)
+                payload = data[offset + HEADER.size:offset + HEADER.size + length]
+                if len(payload) != length or zlib.crc32(payload) != checksum:
+                    break  # a torn write, nothing valid can follow it
+                yield operation, payload
+                offset = offset + HEADER.size + length
+                self.records_since_snapshot = self.records_since_snapshot + 1
+            if offset != len(data):
+                self._drop_after(number, offset)
+                return  # later records may depend on the ones lost, so none of them are replayed
+
+    def _drop_after(self, number, offset):  # cut segment number at offset and delete every later segment
+        with open(self._segment_path(number), "r+b") as f:  # new records then follow valid ones
+            f.truncate(offset)
+        for later in self.segments():
+            if later > number:
+                os.remove(self._segment_path(later))
+        self._segment = number
+
+    def open_segment(self):  # start appending to the current segment
+        self._file = open(self._segment_path(self._segment), "ab", buffering=0)
+
+    def append(self, operation, payload):
+        with self._lock:
+            self._file.write(HEADER.pack(operation, len(payload), zlib.crc32(payload)) + payload)
+            self.records_since_snapshot = self.records_since_snapshot + 1
+            self._unsynced = self._unsynced + 1
+            if self._unsynced >= self.sync_every:
+                self._sync()
+            elif self._timer is None:  # sync within sync_interval even if no more records come
+                self._timer = threading.Timer(self.sync_interval, self._sync_due)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _sync_due(self):  # run by the timer
+        with self._lock:
+            self._timer = None
+            self._sync()
+
+    def _sync(self):  # must hold self._lock
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def sync(self):  # make every record written so far safe from power loss
+        with self._lock:
+            self._sync()
+
+    """
+    write_snapshot method will start a new journal segment, save states as the snapshot which the new
+    segment follows on from, then delete the segments the snapshot has made unnecessary
+    """
+
+    def write_snapshot(self, states):
+        with self._lock:
+            self._sync()
+            self._file.close()
+            self._segment = self._segment + 1
+            self.open_segment()
+
+        fd, temp_path = tempfile.mkstemp(prefix=".snapshot-", suffix=".tmp", dir=self.folder)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({"segment": self._segment, "products": states}, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, os.path.join(self.folder, SNAPSHOT_NAME))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        for number in self.segments():
+            if number < self._segment:
+                os.remove(self._segment_path(number))
+        self.records_since_snapshot = 0
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+
+# a ShoppingCart which journals its changes so it survives restarts and crashes
+class PersistentCart(ShoppingCart):
+    def __init__(self, folder, sync_every=100, sync_interval=0.05, snapshot_every=100000):
+        super().__init__()
+        self.snapshot_every = snapshot_every  # records journalled before a snapshot is taken automatically
+        self._journal = CartJournal(folder, sync_every, sync_interval)
+        self._recover()
+        self._journal.open_segment()
+
+    def _recover(self):  # rebuild the cart from the snapshot and the journal without journalling it again
+        gc_was_enabled = gc.isenabled()
+        gc.disable()  # rebuilding creates millions of objects without reference cycles
+        try:
+            self._replay()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _replay(self):
+        states, operations = self._journal.recover()
+        for state in states:
+            super().addProduct(product_from_state(state))
+        for operation, payload in operations:
+            if operation == OP_ADD:
+                super().addProduct(product_from_state(pickle.loads(payload)))
+            elif operation == OP_REMOVE:
+                super().removeProduct(REMOVE.unpack(payload)[0])
+            elif operation == OP_QUANTITY:
+                unique_id, quantity = QUANTITY.unpack(payload)
+                super().changeProductQuantity(unique_id, quantity)
+
+    def _log(self, operation, payload):
+        self._journal.append(operation, payload)
+        if self._journal.records_since_snapshot >= self.snapshot_every:
+            self.checkpoint()
+
+    # each record is packed before the cart is changed, so a value which cannot be journalled (such as a
+    # quantity too big for the record) raises with the cart left as it was
+    def addProduct(self, p):
+        payload = pickle.dumps(product_state(p), protocol=pickle.HIGHEST_PROTOCOL)
+        super().addProduct(p)
+        self._log(OP_ADD, payload)
+
+    def removeProduct(self, p):  # journalled per line removed, so removing by name replays exactly
+        items = self._findProducts(p)
+        payloads = [REMOVE.pack(item.unique_id) for item in items]
+        for item, payload in zip(items, payloads):
+            super().removeProduct(item.unique_id)
+            self._log(OP_REMOVE, payload)
+
+    def changeProductQuantity(self, p, q):
+        items = self._findProducts(p)
+        payloads = [QUANTITY.pack(item.unique_id, q) for item in items]
+        for item, payload in zip(items, payloads):
+            super().changeProductQuantity(item.unique_id, q)
+            self._log(OP_QUANTITY, payload)
+
+    # write the whole cart out so recovery can skip the journal written so far. Not called snapshot, which
+    # is the in-memory CartSnapshot of ShoppingCart and still works on a PersistentCart
+    def checkpoint(self):
+        self._journal.write_snapshot([product_state(p) for p in self.getProducts()])
+
+    def sync(self):
+        self._journal.sync()
+
+    def close(self):
+        self._journal.close()
@@ -0,0 +1,181 @@
+# imports
+import json
+from bisect import bisect_right
+
+from cart_export import EXPORT_FORMATS, export_cart, product_record
+from cart_import import add_records
+from main import ShoppingCart
+
+"""
+The commands of the interactive program (A/R/S/Q/E/H/T) as an engine which runs structured requests
+against a cart with no prompts, so a session can be replayed from a script or driven by the cart server.
+A request is a dict with a "cmd", given either as the letter used at the prompt or as its name:
+    {"cmd": "A", "products": [{...}, ...]}     add products, given as records like export_cart writes
+    {"cmd": "remove", "id": 1234567890123}     remove a product
+    {"cmd": "quantity", "id": 1234567890123, "quantity": 3}
+    {"cmd": "S"}                                summary of the cart and its totals
+    {"cmd": "E"}                                every product in the cart as export records
+    {"cmd": "E", "path": "cart.json"}          export the cart to a file, "format" may be json or ndjson
+    {"cmd": "H"}                                list the supported commands
+    {"cmd": "T"}                                end the session, no later commands are run
+Every reply is a dict with "ok", and "error" when ok is false.
+
+A command file is NDJSON, one request per line, and is run with run_command_file. Runs of add commands
+are validated and added together in one go rather than one product at a time.
+"""
+
+COMMANDS = {"A": "Add products to the cart",
+            "R": "Remove a product from the cart",
+            "S": "Summary of the cart",
+            "Q": "Change the quantity of a product",
+            "E": "Export the cart as JSON records, or to a file when a path is given",
+            "H": "List the supported commands",
+            "T": "End the session"}
+
+COMMAND_NAMES = {"add": "A", "remove": "R", "summary": "S", "quantity": "Q", "export": "E", "help": "H",
+                 "terminate": "T"}
+
+
+def command_letter(request):  # the letter of the command a request asks for, "" when there is none
+    command = str(request.get("cmd", ""))
+    return COMMAND_NAMES.get(command.lower(), command.upper())
+
+
+def _totals_json(cart):  # totals with the Decimal subtotal as a string so no precision is lost
+    totals = cart.totals()
+    return {"lines": totals["lines"], "units": totals["units"], "subtotal": str(totals["subtotal"])}
+
+
+def _error(message):
+    return {"ok": False, "error": message}
+
+
+def _add_reply(added, errors):
+    return {"ok": not errors, "added": added, "errors": errors}
+
+
+"""
+execute function will run a single request against a cart and return the reply dict. It never raises
+for a bad request, the problem is reported in the reply instead. Exporting to a file is only allowed
+when allow_files is true, so a server can run commands from clients without letting them write files
+"""
+
+
+def execute(cart, request, allow_files=True):
+    command = command_letter(request)
+    if command == "A":
+        products = request.get("products")
+        if not isinstance(products, list):
+            return _error("A needs a list of products")
+        return next(_add_runs(cart, [products]))
+    if command in ("R", "Q"):
+        unique_id = request.get("id")
+        if type(unique_id) is not int:  # checked first, as a list or dict id cannot be looked up
+            return _error("id must be a whole number")
+        if not cart.hasProduct(unique_id):
+            return _error("This product does not exist")
+        if command == "R":
+            cart.removeProduct(unique_id)
+            return {"ok": True}
+        quantity = request.get("quantity")
+        if type(quantity) is not int or quantity < 1:
+            return _error("quantity must be a whole number bigger than 0")
+        cart.changeProductQuantity(unique_id, quantity)
+        return {"ok": True}
+    if command == "S":
+        lines = [{"name": item.name, "unique id": item.unique_id, "quantity": item.quantity,
+                  "price": item.price} for item in cart.getProducts()]
+        return {"ok": True, "lines": lines, "totals": _totals_json(cart)}
+    if command == "E":
+        path = request.get("path")
+        if path is None:
+            return {"ok": True, "products": [product_record(item) for item in cart.getProducts()]}
+        if not allow_files:
+            return _error("Exporting to a file is not allowed here")
+        file_format = request.get("format", "json")
+        if not isinstance(path, str) or file_format not in EXPORT_FORMATS:
+            return _error("E needs a file path and a format of {}".format(" or ".join(EXPORT_FORMATS)))
+        try:
+            export_cart(cart, path, format=file_format)
+        except OSError as e:
+            return _error("Could not export to {}: {}".format(path, e))
+        return {"ok": True, "path": path, "exported": cart.number_of_products}
+    if command == "H":
+        return {"ok": True, "commands": COMMANDS}
+    if command == "T":
+        return {"ok": True}
+    return _error("Command not recognised")
+
+
+def _add_runs(cart, runs):  # add the products of several add commands at once, yielding a reply for each
+    records = []
+    starts = []  # where the products of each command start in records
+    offsets = []  # the position in its own command of each product in records
+    replies = [[] for products in runs]
+    for i, products in enumerate(runs):
+        starts.append(len(records))
+        for j, record in enumerate(products):
+            if isinstance(record, dict):
+                records.append(record)
+                offsets.append(j)
+            else:
+                replies[i].append({"index": j, "unique_id": None, "message": "product is not a JSON object"})
+    result = add_records(cart, records)
+    for e in result.errors:  # e.line counts from 1 through every product of the run
+        i = bisect_right(starts, e.line - 1) - 1
+        replies[i].append({"index": offsets[e.line - 1], "unique_id": e.unique_id, "message": e.message})
+    for i, products in enumerate(runs):
+        errors = sorted(replies[i], key=lambda e: e["index"])
+        rejected = len(set(e["index"] for e in errors))  # a product may have several errors
+        yield _add_reply(len(products) - rejected, errors)
+
+
+"""
+run_commands function will run each request of commands against cart in order and yield its reply.
+Consecutive add commands are added together, and running stops after a T command
+"""
+
+
+def run_commands(cart, commands, allow_files=True):
+    pending = []  # the product lists of the add commands waiting to be run
+    for request in commands:
+        if isinstance(request, dict) and command_letter(request) == "A" and \
+                isinstance(request.get("products"), list):
+            pending.append(request["products"])
+            continue
+        if pending:
+            for reply in _add_runs(cart, pending):
+                yield reply
+            pending = []
+        if not isinstance(request, dict):
+            yield _error("Request must be a JSON object")
+            continue
+        yield execute(cart, request, allow_files)
+        if command_letter(request) == "T":
+            return
+    if pending:
+        for reply in _add_runs(cart, pending):
+            yield reply
+
+
+def _read_requests(f):  # the request on each line of an NDJSON file, or None when the line is not JSON
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+"""
+run_command_file function will run every request in the NDJSON file at path against cart, a new
+ShoppingCart by default, and return the cart and the list of replies, one per request
+"""
+
+
+def run_command_file(path, cart=None):
+    cart = cart if cart is not None else ShoppingCart()
+    with open(path, "r", encoding="utf-8") as f:
+        replies = list(run_commands(cart, _read_requests(f)))
+    return cart, replies
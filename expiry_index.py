@@ -0,0 +1,123 @@
+# imports
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from main import Food
+
+"""
+An index of the Food lines of a cart sorted by expiry date, kept up to date through the cart's change
+listener. Entries are (expiry date, unique id) pairs kept in order in a list of short sorted chunks, so
+adding or removing an entry only shifts one chunk, and finding everything which expires before a date
+is a binary search followed by reading off the front, O(log n + k). The expired lines are always at the
+front, so purging them never has to look at the rest of the cart.
+"""
+
+CHUNK_SIZE = 1000  # chunks are split when they grow past twice this
+
+
+class _SortedEntries:  # a sorted list stored as chunks, with the last entry of each chunk kept for searching
+    def __init__(self):
+        self._chunks = []
+        self._maxes = []
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def add(self, entry):
+        self._length = self._length + 1
+        if not self._chunks:
+            self._chunks.append([entry])
+            self._maxes.append(entry)
+            return
+        i = bisect_left(self._maxes, entry)
+        if i == len(self._chunks):  # bigger than everything, it goes at the end of the last chunk
+            i = i - 1
+            self._chunks[i].append(entry)
+            self._maxes[i] = entry
+        else:
+            insort(self._chunks[i], entry)
+        if len(self._chunks[i]) > 2 * CHUNK_SIZE:
+            chunk = self._chunks[i]
+            self._chunks[i:i + 1] = [chunk[:CHUNK_SIZE], chunk[CHUNK_SIZE:]]
+            self._maxes[i:i + 1] = [chunk[CHUNK_SIZE - 1], chunk[-1]]
+
+    def discard(self, entry):  # remove entry if it is there
+        i = bisect_left(self._maxes, entry)
+        if i == len(self._chunks):
+            return
+        chunk = self._chunks[i]
+        j = bisect_left(chunk, entry)
+        if j == len(chunk) or chunk[j] != entry:
+            return
+        del chunk[j]
+        self._length = self._length - 1
+        if not chunk:
+            del self._chunks[i]
+            del self._maxes[i]
+        elif j == len(chunk):
+            self._maxes[i] = chunk[-1]
+
+    def before(self, entry):  # every entry smaller than entry, in order
+        found = []
+        for i, chunk in enumerate(self._chunks):
+            if self._maxes[i] < entry:
+                found.extend(chunk)
+            else:
+                found.extend(chunk[:bisect_left(chunk, entry)])
+                break
+        return found
+
+    def pop_before(self, entry):  # remove and return every entry smaller than entry
+        found = self.before(entry)
+        whole = bisect_left(self._maxes, entry)  # the chunks holding nothing but smaller entries
+        del self._chunks[:whole]
+        del self._maxes[:whole]
+        if self._chunks:  # the next chunk may start with some smaller entries too
+            del self._chunks[0][:bisect_left(self._chunks[0], entry)]
+        self._length = self._length - len(found)
+        return found
+
+
+class ExpiryIndex:
+    def __init__(self, cart):
+        self.cart = cart
+        self._entries = _SortedEntries()
+        for p in cart.getProducts():
+            self._changed("add", p)
+        cart.addListener(self._changed)
+
+    def close(self):  # stop following the cart
+        self.cart.removeListener(self._changed)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _changed(self, event, p):
+        if not isinstance(p, Food) or not isinstance(p.expiry_date, datetime):
+            return
+        entry = (p.expiry_date, p.unique_id)
+        if event == "add":
+            self._entries.add(entry)
+        elif event == "remove":  # a purge may have dropped the entry already
+            self._entries.discard(entry)
+
+    def expiring_before(self, date):  # the Food lines which expire before date, soonest first
+        return [self.cart.getProduct(unique_id) for expiry_date, unique_id in self._entries.before((date,))]
+
+    def expiring_within(self, days, today=None):  # the Food lines which expire in the next `days` days
+        today = today or datetime.today()
+        return self.expiring_before(today + timedelta(days=days))
+
+    """
+    purge_expired method will remove every Food line which expired before today from the cart, taking
+    them off the front of the index in one go, and return the products removed
+    """
+
+    def purge_expired(self, today=None):
+        expired = self._entries.pop_before((today or datetime.today(),))
+        removed = []
+        for expiry_date, unique_id in expired:
+            removed.append(self.cart.getProduct(unique_id))
+            self.cart.removeProduct(unique_id)
+        return removed
@@ -0,0 +1,294 @@
+# imports
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+import cart_export
+import main
+from main import ShoppingCart
+
+"""
+Opt-in instrumentation of the cart hot paths. Nothing is measured until enable() is called: it swaps
+the instrumented functions for timed wrappers and disable() puts the originals back, so a program which
+never enables it runs exactly the code it would have run without this module.
+
+While enabled, every call of an instrumented operation is counted and its latency added to a histogram,
+and after each change to a cart the number of lines and units in it are recorded as gauges. The gauges
+are shared by every cart in the process, so with many carts (the server or the registry) they describe
+whichever cart changed last, hence their names last_cart_lines and last_cart_units; cart_lines_max is
+the most lines any cart has held. snapshot()
+returns everything as a dict, which json_text() and prometheus_text() turn into a JSON document or the
+Prometheus text exposition format.
+
+profile_session() and sample_session() are context managers for looking at a whole session: the first
+runs cProfile, the second samples the stack of the running thread every few milliseconds, which costs
+far less and gives a rougher picture.
+"""
+
+# the cart methods timed, and the functions timed wherever a module has imported them
+CART_OPERATIONS = ["addProduct", "removeProduct", "changeProductQuantity", "checkProductExist", "getContents"]
+FUNCTIONS = [(main, "product_id_check"), (cart_export, "export_cart")]
+CHANGES = ("addProduct", "removeProduct", "changeProductQuantity")  # the operations after which gauges are set
+
+# upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+           0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_BUCKET_NS = [int(b * 1e9) for b in BUCKETS]
+
+
+class Histogram:  # call count, total time and a count per latency bucket, the last bucket being everything slower
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, ns):
+        self.count = self.count + 1
+        self.total_ns = self.total_ns + ns
+        self.buckets[bisect_left(_BUCKET_NS, ns)] += 1
+
+    def quantile(self, q):  # the upper bound of the bucket holding the q quantile, None when it is past the last one
+        if not self.count:
+            return None
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen = seen + n
+            if seen >= q * self.count:
+                return BUCKETS[i] if i < len(BUCKETS) else None
+        return None
+
+
+class Metrics:  # the counters, histograms and gauges collected while instrumentation is enabled
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, operation, ns):
+        with self._lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = Histogram()
+            histogram.observe(ns)
+
+    def set_cart_gauges(self, cart):  # the size of the cart changed last, and the largest of any cart
+        lines = cart.number_of_products
+        self.gauges["last_cart_lines"] = lines
+        self.gauges["last_cart_units"] = cart.totals()["units"]
+        self.gauges["cart_lines_max"] = max(lines, self.gauges.get("cart_lines_max", 0))
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.gauges = {}
+
+    """
+    snapshot method will return the metrics collected so far as a dict holding, for each operation, its
+    call count, total and mean seconds, an estimate of the median and 99th percentile latency taken from
+    the histogram, and the count in each bucket, plus the gauges
+    """
+
+    def snapshot(self):
+        with self._lock:
+            operations = {}
+            for operation, h in sorted(self.histograms.items()):
+                operations[operation] = {"count": h.count, "seconds": h.total_ns / 1e9,
+                                         "mean_seconds": h.total_ns / 1e9 / h.count if h.count else 0.0,
+                                         "p50_seconds": h.quantile(0.5), "p99_seconds": h.quantile(0.99),
+                                         "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], h.buckets))}
+            return {"operations": operations, "gauges": dict(self.gauges)}
+
+    def json_text(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def prometheus_text(self):  # the metrics in the Prometheus text exposition format
+        out = ["# HELP cart_operation_seconds Latency of cart operations.",
+               "# TYPE cart_operation_seconds histogram"]
+        with self._lock:
+            for operation, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, n in zip([repr(b) for b in BUCKETS] + ["+Inf"], h.buckets):
+                    cumulative = cumulative + n
+                    out.append('cart_operation_seconds_bucket{{operation="{}",le="{}"}} {}'.format(
+                        operation, bound, cumulative))
+                out.append('cart_operation_seconds_sum{{operation="{}"}} {}'.format(operation, h.total_ns / 1e9))
+                out.append('cart_operation_seconds_count{{operation="{}"}} {}'.format(operation, h.count))
+            for name, value in sorted(self.gauges.items()):
+                out.append("# TYPE {} gauge".format(name))
+                out.append("{} {}".format(name, value))
+        return "\n".join(out) + "\n"
+
+
+METRICS = Metrics()  # where enable() records to unless it is given another Metrics
+_originals = []  # (owner, name, original) for every attribute replaced by enable()
+_active = threading.local()  # set while a timed cart operation runs in this thread
+
+
+def _timed_method(metrics, name, method):
+    perf_counter_ns = time.perf_counter_ns
+    changes_cart = name in CHANGES
+
+    @wraps(method)
+    def timed(self, *args, **kwargs):
+        if getattr(_active, "timing", False):  # called from a timed operation, e.g. a subclass calling super()
+            return method(self, *args, **kwargs)
+        _active.timing = True
+        start = perf_counter_ns()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            metrics.observe(name, perf_counter_ns() - start)
+            _active.timing = False
+            if changes_cart:
+                metrics.set_cart_gauges(self)
+    return timed
+
+
+def _timed_function(metrics, name, function):
+    perf_counter_ns = time.perf_counter_ns
+
+    @wraps(function)
+    def timed(*args, **kwargs):
+        start = perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            metrics.observe(name, perf_counter_ns() - start)
+    return timed
+
+
+def _replace(owner, name, replacement):
+    _originals.append((owner, name, getattr(owner, name)))
+    setattr(owner, name, replacement)
+
+
+def enabled():
+    return bool(_originals)
+
+
+def _cart_classes(cls):  # ShoppingCart and every subclass of it which has been loaded
+    yield cls
+    for subclass in cls.__subclasses__():
+        for c in _cart_classes(subclass):
+            yield c
+
+
+"""
+enable function will start timing the cart operations, recording to metrics (METRICS by default). The
+methods are replaced on ShoppingCart and on every subclass loaded by then which overrides them (such as
+PersistentCart, so journalling is timed), which times carts which already exist too. An operation is
+timed once, by its outermost call, even when an override calls the method it overrides. The functions
+are replaced in every loaded module which imported them
+"""
+
+
+def enable(metrics=None):
+    if enabled():
+        return
+    metrics = metrics or METRICS
+    for cls in list(_cart_classes(ShoppingCart)):
+        for name in CART_OPERATIONS:
+            if name in vars(cls):  # subclasses which do not override the method use the timed one inherited
+                _replace(cls, name, _timed_method(metrics, name, vars(cls)[name]))
+    for module, name in FUNCTIONS:
+        function = getattr(module, name)
+        timed = _timed_function(metrics, name, function)
+        for loaded in list(sys.modules.values()):
+            if getattr(loaded, name, None) is function:
+                _replace(loaded, name, timed)
+
+
+def disable():  # put back every original function, after which nothing is measured
+    while _originals:
+        owner, name, original = _originals.pop()
+        setattr(owner, name, original)
+
+
+@contextmanager
+def instrumented(metrics=None):  # enable instrumentation for the length of a with block
+    was_enabled = enabled()
+    enable(metrics)
+    try:
+        yield metrics or METRICS
+    finally:
+        if not was_enabled:
+            disable()
+
+
+"""
+profile_session function is a context manager which runs cProfile over the with block. When it ends the
+statistics are written to path, which can be opened with pstats or snakeviz, or when no path is given the
+top functions sorted by sort are printed
+"""
+
+
+@contextmanager
+def profile_session(path=None, sort="cumulative", top=25):
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        if path is not None:
+            profile.dump_stats(path)
+        else:
+            out = io.StringIO()
+            pstats.Stats(profile, stream=out).sort_stats(sort).print_stats(top)
+            print(out.getvalue())
+
+
+class StackSampler:  # samples the stack of one thread from a background thread
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()  # collapsed stack -> number of times it was seen
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append("{}:{}".format(frame.f_code.co_filename.rsplit("/", 1)[-1], frame.f_code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):  # one "stack count" line per stack, the input format of flame graph tools
+        return "".join("{} {}\n".format(stack, n) for stack, n in self.samples.most_common())
+
+
+"""
+sample_session function is a context manager which samples the stack of the calling thread every
+interval seconds during the with block, writing the collapsed stacks to path if one is given
+"""
+
+
+@contextmanager
+def sample_session(path=None, interval=0.005):
+    sampler = StackSampler(threading.get_ident(), interval)
+    sampler.start()
+    try:
+        yield sampler
+    finally:
+        sampler.stop()
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(sampler.collapsed())
@@ -1,10 +1,31 @@
 # imports
+import copy
 from datetime import datetime
+from decimal import Decimal
 import json
+import operator
+import sys
+
+from cart_export import export_cart
+from cart_snapshot import CartSnapshot, diff
+
+# accepted values shared by the interactive validators and the bulk loaders
+PRODUCT_TYPES = ['Food', 'Clothing', 'Toys']
+VALID_SIZES = ['XXS', 'XS', 'S', 'M', 'L', 'XL', 'XXL']
+VALID_GENDERS = ['m', 'f']
+TRUE_VALUES = ['true', '1', 't', 'y', 'yes']
+FALSE_VALUES = ['false', '0', 'f', 'n', 'no']
+DATE_FORMAT = "%d/%m/%Y"
+ID_LENGTH = 13
 
 
 # Defining the general structure of a product
+# __slots__ keeps products small as they carry no per-instance __dict__. Each subclass lists its extra
+# attributes in the same order its __init__ takes them, so the slots can be used to rebuild a product.
+# _export holds the product's encoded export once cart_export has made it, see cart_export.product_bytes
 class Product:
+    __slots__ = ("name", "price", "quantity", "unique_id", "brand", "_export")
+
     def __init__(self, name, price, quantity, brand, unique_id):  # each product must have the following attributes
         self.name = name
         self.price = price
@@ -15,6 +36,8 @@ class Product:
 
 # Subclasses of product initialised using the super() method to include all attributes of Product
 class Clothing(Product):
+    __slots__ = ("size", "materials")
+
     def __init__(self, name, price, quantity, brand, unique_id, size, materials):
         super().__init__(name, price, quantity, brand, unique_id)
         self.size = size
@@ -33,6 +56,8 @@ class Clothing(Product):
 
 
 class Food(Product):
+    __slots__ = ("expiry_date", "gluten_free", "suitable_for_vegans")
+
     def __init__(self, name, price, quantity, brand, unique_id, expiry_date, gluten_free, suitable_for_vegans):
         super().__init__(name, price, quantity, brand, unique_id)
         self.expiry_date = expiry_date
@@ -41,7 +66,7 @@ class Food(Product):
 
     # to_json will generate a json representation of the product
     def to_json(self):
-        datetime_as_str = self.expiry_date.strftime("%d/%m/%Y")  # date is not a jsonable format so change to string
+        datetime_as_str = self.expiry_date.strftime(DATE_FORMAT)  # date is not a jsonable format so change to string
         food_json = {"price": self.price,
                      "quantity": self.quantity,
                      "brand": self.brand,
@@ -54,6 +79,8 @@ class Food(Product):
 
 
 class Toys(Product):
+    __slots__ = ("minimum_age", "gender")
+
     def __init__(self, name, price, quantity, brand, unique_id, minimum_age, gender):
         super().__init__(name, price, quantity, brand, unique_id)
         self.gender = gender
@@ -70,31 +97,254 @@ class Toys(Product):
                      }
         return toys_json
 
+def to_money(price):  # exact Decimal value of a price, going through str so 9.99 stays 9.99
+    if isinstance(price, Decimal):
+        return price
+    return Decimal(str(price))
+
+
+# the comparisons which can be used in ShoppingCart.query, as in query(minimum_age__lte=5)
+QUERY_OPERATORS = {"lt": operator.lt, "lte": operator.le, "gt": operator.gt, "gte": operator.ge,
+                   "ne": operator.ne}
+# the attributes ShoppingCart.query can filter on, the ones _FacetIndex indexes
+QUERY_FIELDS = ("type", "name", "brand", "price") + Clothing.__slots__ + Food.__slots__ + Toys.__slots__
+
+
+# secondary indexes over the attributes of the products in a cart, used by ShoppingCart.query.
+# For every attribute (plus "type", the name of the product class) it keeps the set of ids for each value
+class _FacetIndex:
+    def __init__(self, products):
+        self._facets = {}  # attribute -> {value: set of unique ids}
+        self._positions = {}  # unique id -> order it was added in, so results come back in cart order
+        self._next_position = 0
+        for p in products:
+            self.add(p)
+
+    @staticmethod
+    def _values(p):  # the (attribute, value) pairs a product is indexed under
+        values = [("type", type(p).__name__), ("name", p.name), ("brand", p.brand), ("price", p.price)]
+        return values + [(field, getattr(p, field)) for field in type(p).__slots__]
+
+    def add(self, p):
+        self._positions[p.unique_id] = self._next_position
+        self._next_position = self._next_position + 1
+        for field, value in self._values(p):
+            self._facets.setdefault(field, {}).setdefault(value, set()).add(p.unique_id)
+
+    def remove(self, p):
+        del self._positions[p.unique_id]
+        for field, value in self._values(p):
+            ids = self._facets[field][value]
+            ids.discard(p.unique_id)
+            if not ids:  # forget values which are no longer used
+                del self._facets[field][value]
+
+    def match(self, field, compare, value):  # the ids whose attribute compares as asked with value
+        values = self._facets.get(field, {})
+        if compare is None:
+            return values.get(value, set())
+        matched = set()
+        for candidate, ids in values.items():  # one check per distinct value, not per product
+            try:
+                if compare(candidate, value):
+                    matched |= ids
+            except TypeError:  # values which cannot be compared, such as a missing date, never match
+                pass
+        return matched
+
+    def order(self, ids):
+        return sorted(ids, key=self._positions.__getitem__)
+
+
+# products are the same variant if their type, name, brand, price and every field of their own class match,
+# e.g. shirts of two sizes or toys for two ages are kept apart, so merging never loses a field
+def variant_key(p):
+    return (type(p).__name__, p.name, p.brand, p.price) + tuple(getattr(p, field) for field in type(p).__slots__)
+
+
+# the ways a cart can merge repeated products into one line, see ShoppingCart
+MERGE_KEYS = {"unique_id": operator.attrgetter("unique_id"), "variant": variant_key}
+
+
 # a class which stores what products are in and out of the shopping cart
 class ShoppingCart:
-    def __init__(self, cart_list=[], number_of_products=0):
-        self.cart_list = cart_list  # we store the products in a list
-        self.number_of_products = number_of_products  # counts the number of products within the cart
+    """
+    A cart made with merge_key merges a product which is added again into the line already holding it,
+    adding to that line's quantity rather than making a new line. merge_key is "unique_id", "variant"
+    (the same type, name, brand, price and class fields, see variant_key) or a function returning the key
+    of a product
+    """
+
+    def __init__(self, cart_list=None, merge_key=None):
+        self._lines = {}  # we store the products in a dict keyed by unique_id, which keeps insertion order
+        self._name_index = {}  # maps a product name to the unique_ids using it (a dict used as an ordered set)
+        self._subtotal = Decimal(0)  # running totals, kept up to date by every change to the cart
+        self._units = 0
+        self._listeners = []  # called with (event, product) after every change, see addListener
+        self._facets = None  # built by the first call to query, then kept up to date
+        self._merge_key = MERGE_KEYS.get(merge_key, merge_key)  # None unless lines are merged
+        self._merged_lines = {}  # merge key -> unique_id of the line holding it
+        self._snapshots = []  # the snapshots to hand each line to before it changes, see snapshot
+        if cart_list:  # a starting list of products can still be given
+            self.addMany(cart_list)
+
+    @property
+    def cart_list(self):  # a list copy of the products in the cart, in the order they were added
+        return list(self._lines.values())
+
+    @property
+    def number_of_products(self):  # counts the number of products (lines) within the cart
+        return len(self._lines)
 
     """
-    addProduct method will get a product of type class Product and will add it to the cart list
-    and will add 1 to the number of products
+    addProduct method will get a product of type class Product and will add it to the cart
+    and will add its cost to the running totals. It returns the line now holding the product,
+    which is an existing line when the cart merges lines and already has one for it
     """
 
     def addProduct(self, p):
-        self.cart_list.append(p)
-        self.number_of_products = self.number_of_products + 1
+        if self._merge_key is not None:
+            key = self._merge_key(p)
+            unique_id = self._merged_lines.get(key)
+            if unique_id is not None:
+                line = self._lines[unique_id]
+                self._setQuantity(line, line.quantity + p.quantity)
+                return line
+            self._addLine(p)
+            self._merged_lines[key] = p.unique_id
+            return p
+        self._addLine(p)
+        return p
+
+    """
+    addMany method will add every product of products, first adding together the quantities of products
+    which share a merge key so each line is only touched once. It returns the number of new lines
+    """
+
+    def addMany(self, products):
+        lines = self.number_of_products
+        if self._merge_key is None:
+            for p in products:
+                self.addProduct(p)
+            return self.number_of_products - lines
+        batch = {}  # merge key -> [the first product with it, the quantity of them all]
+        for p in products:
+            key = self._merge_key(p)
+            first = batch.get(key)
+            if first is None:
+                batch[key] = [p, p.quantity]
+            else:
+                first[1] = first[1] + p.quantity
+        for p, quantity in batch.values():
+            if quantity != p.quantity:  # a copy holds the sum, so the caller's products are left as they were
+                p = copy.copy(p)
+                p.quantity = quantity
+            self.addProduct(p)
+        return self.number_of_products - lines
+
+    def mergesIds(self):  # whether a product whose unique id is already in the cart is added to that line
+        return self._merge_key is MERGE_KEYS["unique_id"]
+
+    def _addLine(self, p):  # add p as a line of its own
+        if p.unique_id in self._lines:  # a unique id can only be used by one line
+            raise ValueError("Product {} is already in the cart".format(p.unique_id))
+        if self._snapshots:
+            self._copyOnWrite(p.unique_id, None)
+        self._lines[p.unique_id] = p
+        self._name_index.setdefault(p.name, {})[p.unique_id] = None
+        self._subtotal = self._subtotal + p.quantity * to_money(p.price)
+        self._units = self._units + p.quantity
+        if self._facets is not None:
+            self._facets.add(p)
+        self._notify("add", p)
 
     """
-    removeProduct method will get a product of type class Product and will remove it from the cart list
-    and will remove 1 to the number of products
+    removeProduct method will get the unique id (or the name) of a product and will remove it from the cart
+    and will take its cost away from the running totals
     """
 
     def removeProduct(self, p):
-        for cart_product in self.cart_list:  # iterate over all products
-            if cart_product.name == p:  # check if product is current product
-                self.cart_list.remove(cart_product)
-                self.number_of_products = self.number_of_products - 1
+        for item in self._findProducts(p):
+            self._removeLine(item)
+
+    def _removeLine(self, item):  # drop a single line from the cart, the name index and the totals
+        if self._snapshots:
+            self._copyOnWrite(item.unique_id, item)
+        del self._lines[item.unique_id]
+        ids = self._name_index[item.name]
+        del ids[item.unique_id]
+        if not ids:  # forget names which are no longer used
+            del self._name_index[item.name]
+        self._subtotal = self._subtotal - item.quantity * to_money(item.price)
+        self._units = self._units - item.quantity
+        if self._facets is not None:
+            self._facets.remove(item)
+        if self._merge_key is not None:
+            del self._merged_lines[self._merge_key(item)]
+        self._notify("remove", item)
+
+    """
+    addListener method will register a function which is called as listener(event, product) after every
+    change to the cart, where event is "add", "remove" or "quantity". It lets other structures, such as
+    the pricing engine, keep up to date with the cart without going over all of it
+    """
+
+    def addListener(self, listener):
+        self._listeners.append(listener)
+
+    def removeListener(self, listener):
+        self._listeners.remove(listener)
+
+    def _notify(self, event, p):
+        for listener in self._listeners:
+            listener(event, p)
+
+    def _findProducts(self, p):  # the lines matching p, which is either a unique id or a product name
+        item = self._lines.get(p)
+        if item is not None:
+            return [item]
+        return [self._lines[i] for i in self._name_index.get(p, ())]
+
+    def getProduct(self, unique_id):  # return the product with the given unique id, or None
+        return self._lines.get(unique_id)
+
+    def getProductsByName(self, name):  # return every product using the given name
+        return [self._lines[i] for i in self._name_index.get(name, ())]
+
+    def getProducts(self):  # a live view of the products in the cart, in the order they were added
+        return self._lines.values()
+
+    """
+    query method will return the products matching every filter given, in the order they were added.
+    Filters are attribute=value, or attribute__op=value where op is one of lt, lte, gt, gte or ne, e.g.
+    query(type="Food", gluten_free=True) or query(brand="Acme", minimum_age__lte=5). The attributes which
+    can be used are those in QUERY_FIELDS, any other raises ValueError.
+    Each filter is a lookup in an index, and the filters are combined by set intersection
+    """
+
+    def query(self, **filters):
+        if self._facets is None:
+            self._facets = _FacetIndex(self._lines.values())
+        matches = []
+        for key, value in filters.items():
+            field, _, op = key.partition("__")
+            if field not in QUERY_FIELDS:  # it would match nothing rather than tell of the mistake
+                raise ValueError("Cannot query on {}, expected one of {}".format(field, ", ".join(QUERY_FIELDS)))
+            if op and op not in QUERY_OPERATORS:
+                raise ValueError("Unknown query operator {}, expected one of {}".format(
+                    op, ", ".join(QUERY_OPERATORS)))
+            matches.append(self._facets.match(field, QUERY_OPERATORS.get(op), value))
+        if not matches:
+            return list(self._lines.values())
+        matches.sort(key=len)  # intersect starting from the smallest set
+        ids = matches[0].intersection(*matches[1:])
+        return [self._lines[i] for i in self._facets.order(ids)]
+
+    def getIds(self):  # a live view of the unique ids used in the cart
+        return self._lines.keys()
+
+    def hasProduct(self, unique_id):  # check if the unique id is used in the cart without printing anything
+        return unique_id in self._lines
 
     """
     getContents method will return the current contents of the ShoppingCart
@@ -103,37 +353,85 @@ class ShoppingCart:
     def getContents(self):
         print("This is the total of the expenses:")
         i = 1
-        total_cost = 0
-        for item in self.cart_list:
+        for item in self._lines.values():
             if item.quantity == 1:  # if there is only one of the product in the cart then print a certain way
-                print("\t{} - {} = £{}".format(i, item.name, item.price))
-                total_cost = total_cost + item.price  # add to total cost
+                print("\t{} - {} = £{}".format(i, item.name, to_money(item.price)))
             else:  # if there is more than one of the product in the cart print a different way
-                indiv_cost = item.quantity * item.price
+                indiv_cost = item.quantity * to_money(item.price)
                 print("\t{} - {} * {} = £{}".format(i, item.quantity, item.name, indiv_cost))
-                total_cost = total_cost + indiv_cost  # add to total cost
 
             i = i + 1  # print out the number in the cart
 
-        print("\tTotal = £{}".format((total_cost)))  # print total cost
+        print("\tTotal = £{}".format(self._subtotal))  # print total cost from the running total
+
+    """
+    totals method will return the running totals of the cart without going over its contents:
+    the number of lines, the number of units and the subtotal as a Decimal
+    """
+
+    def totals(self):
+        return {"lines": len(self._lines), "units": self._units, "subtotal": self._subtotal}
+
+    def recomputeTotals(self):  # the same totals worked out from scratch, useful to check the running ones
+        subtotal = Decimal(0)
+        units = 0
+        for item in self._lines.values():
+            subtotal = subtotal + item.quantity * to_money(item.price)
+            units = units + item.quantity
+        return {"lines": len(self._lines), "units": units, "subtotal": subtotal}
 
     def changeProductQuantity(self, p, q):  # change the quantity, q of product, p in the cart
-        for item in self.cart_list:
-            if item.name == p:
-                item.quantity = q
+        for item in self._findProducts(p):
+            self._setQuantity(item, q)
+
+    def _setQuantity(self, item, q):
+        if self._snapshots:
+            self._copyOnWrite(item.unique_id, item)
+        difference = q - item.quantity  # only the change in quantity needs adding to the totals
+        self._subtotal = self._subtotal + difference * to_money(item.price)
+        self._units = self._units + difference
+        item.quantity = q
+        self._notify("quantity", item)
+
+    """
+    snapshot method will return a CartSnapshot, a read-only copy of the cart as it is now. Taking one is
+    O(1): the snapshot shares the lines of the cart, and each line is only handed to it when the cart is
+    about to change that line. Every change to the cart costs a little more for each open snapshot, so
+    close snapshots which are no longer needed
+    """
+
+    def snapshot(self):
+        s = CartSnapshot(self)
+        self._snapshots.append(s)
+        return s
+
+    def releaseSnapshot(self, s):
+        self._snapshots.remove(s)
+
+    def _copyOnWrite(self, unique_id, item):  # hand the line as it is now to every snapshot before it changes
+        for s in self._snapshots:
+            s._record(unique_id, item)
+
+    def restore(self, s):  # undo every change made since the snapshot s of this cart was taken
+        changes = diff(self, s)  # only looks at the lines changed since s was taken
+        for p in changes.removed:  # lines which were added since
+            self.removeProduct(p.unique_id)
+        for p, old, new in changes.quantities:
+            self.changeProductQuantity(p.unique_id, new)
+        for p in changes.added:  # lines which were removed since
+            self.addProduct(p)
 
     def checkProductExist(self, p):  # check product p exists in the cart
-        for item in self.cart_list:
-            if item.unique_id == p:
-                return True
+        if p in self._lines:
+            return True
         print("This product does not exist")
         print("These are the items in your list:")
-        for item in self.cart_list:
+        for item in self._lines.values():
             print("\tName: {} - \t - \tUnique ID: {}".format(item.name, item.unique_id))
         return False
 
     def checkListLength(self):  # check the length of the list
-        return len(self.cart_list)
+        return len(self._lines)
 
 
 # This function will print out all possibilities the user can choose from
@@ -163,7 +461,7 @@ def type_validation(input_value):
 
     input_value = input_string_formatting(input_value)  # formatting string to standard type
 
-    if input_value in ['Food', 'Clothing', 'Toys']:  # if type is accepted return True otherwise return false
+    if input_value in PRODUCT_TYPES:  # if type is accepted return True otherwise return false
         return True
     else:  # otherwise return that the type entered is false
         print("Please enter a valid type [Food, Clothing, Toys]")
@@ -171,14 +469,14 @@ def type_validation(input_value):
 
 
 def size_validation(size):  # check that it is a valid size
-    if size.upper() in ['XXS', 'XS', 'S', 'M', 'L', 'XL', 'XXL']:
+    if size.upper() in VALID_SIZES:
         return True
     else:
         print("Please enter a valid size [XXS, XS, S, M, L, XL, XXL]! ")
 
 
 def gender_validation(gender):  # check that the gender is a valid input
-    if gender.lower() in ['m', 'f']:  # .lower() means that we can handle uppercase and lowercase
+    if gender.lower() in VALID_GENDERS:  # .lower() means that we can handle uppercase and lowercase
         return True
     else:
         print("Please enter either 'f' or 'm'.")
@@ -205,7 +503,7 @@ def int_check(test_int):  # testing to see if a value is an integer
 
 def float_check(test_float):  # testing the input is a float
     if isinstance(test_float, float):  # check if input is float
-        if float(test_float) <= 0:  # making sure that the input is positive
+        if not 0 < test_float < float("inf"):  # making sure that the input is positive, and not inf or nan
             print("Please enter a floating point number bigger than 0")
             return False
         else:
@@ -215,13 +513,12 @@ def float_check(test_float):  # testing the input is a float
         return False
 
 
-def product_id_check(test_id):  # this function is to check whether or not an id already exists in the cart
+def product_id_check(test_id, cart):  # this function is to check whether or not an id already exists in the cart
     id_exists = 0
     if isinstance(test_id, int):  # make sure input is an integer
-        if len(str(test_id)) == 13:  # make sure length of the id is 13
-            for item in cart.cart_list:  # go through all items to test their ids
-                if item.unique_id == test_id:  # if id is existant, change id_exists to 1
-                    id_exists = 1
+        if len(str(test_id)) == ID_LENGTH:  # make sure length of the id is 13
+            if cart.hasProduct(test_id) and not cart.mergesIds():  # if id is existant, change id_exists to 1
+                id_exists = 1
             if id_exists != 0:  # if id_exists is 1 print that it exists and return False (the input is not vali)
                 print("This ID number already exists!")
                 return False
@@ -237,9 +534,8 @@ def product_id_check(test_id):  # this function is to check whether or not an id
 
 def date_check(test_date):  # checking that date is in the right format
     try:
-        datetime.strptime(test_date, "%d/%m/%Y")
-        if datetime.strptime(test_date,
-                             "%d/%m/%Y") < datetime.today():  # making sure that the product has not expired yet
+        expiry_date = datetime.strptime(test_date, DATE_FORMAT)  # parse the date once
+        if expiry_date < datetime.today():  # making sure that the product has not expired yet
             print("This product has expired! Enter a date in the future.")
             return False
         else:
@@ -282,9 +578,9 @@ def input_float_formatting(input_float):  # will check if input can be formatted
 
 
 def input_bool_formatting(input_bool):  # will check a few different accepted values for bools
-    if input_bool.lower() in ['true', '1', 't', 'y', 'yes']:  # if in this accepted value for bools return true
+    if input_bool.lower() in TRUE_VALUES:  # if in this accepted value for bools return true
         return True
-    if input_bool.lower() in ['false', '0', 'f', 'n', 'no']:  # if in this accepted value for bools return false
+    if input_bool.lower() in FALSE_VALUES:  # if in this accepted value for bools return false
         return False
     else:
         print("Please enter a Boolean value (True\False)")
@@ -293,14 +589,13 @@ def input_bool_formatting(input_bool):  # will check a few different accepted va
 
 def input_date_formatting(input_date):  # formats the date if possible to a value which can be processed by program
     try:
-        datetime.strptime(input_date, "%d/%m/%Y")
-        return datetime.strptime(input_date, "%d/%m/%Y")
+        return datetime.strptime(input_date, DATE_FORMAT)
     except ValueError:
         print("Incorrect data format, should be DD/MM/YYY")
         return input_date
 
 
-def create_product():  # creating a new product from thin air
+def create_product(cart):  # creating a new product from thin air and adding it to cart
     print("Adding a new product:")
     type_is_valid = False
 
@@ -310,11 +605,11 @@ def create_product():  # creating a new product from thin air
 
     new_product_type = input_string_formatting(new_product_type)  # reset formatting
     if new_product_type == 'Clothing':  # branch depending on product type, create an object of the product class
-        create_clothing()
+        create_clothing(cart)
     if new_product_type == 'Food':
-        create_food()
+        create_food(cart)
     if new_product_type == 'Toys':
-        create_toys()
+        create_toys(cart)
 
 
 """
@@ -327,8 +622,8 @@ I will comment the first one as the others follow a similar sturcture
 """
 
 
-def create_clothing():  # create object of clothing type
-    clothing_name, clothing_price, clothing_quantity, clothing_brand, clothing_ID = standardProductInputs()  # first get the inputs for a regular product
+def create_clothing(cart):  # create object of clothing type
+    clothing_name, clothing_price, clothing_quantity, clothing_brand, clothing_ID = standardProductInputs(cart)  # first get the inputs for a regular product
 
     size_is_valid = False  # set the input validities to false
     material_is_valid = False
@@ -350,8 +645,8 @@ def create_clothing():  # create object of clothing type
     print("The cart contains {} products".format(cart.number_of_products))
 
 
-def create_food():
-    food_name, food_price, food_quantity, food_brand, food_ID = standardProductInputs()
+def create_food(cart):
+    food_name, food_price, food_quantity, food_brand, food_ID = standardProductInputs(cart)
 
     expiry_date_is_valid = False
     gf_is_valid = 12
@@ -378,8 +673,8 @@ def create_food():
     print("The cart contains {} products".format(cart.number_of_products))
 
 
-def create_toys():
-    toy_name, toy_price, toy_quantity, toy_brand, toy_ID = standardProductInputs()
+def create_toys(cart):
+    toy_name, toy_price, toy_quantity, toy_brand, toy_ID = standardProductInputs(cart)
     is_gender_valid = False
     is_mini_int = False
 
@@ -398,7 +693,7 @@ def create_toys():
     print("The cart contains {} products".format(cart.number_of_products))
 
 
-def standardProductInputs():  # standard product input will get the inputs for each product and will return it to the
+def standardProductInputs(cart):  # standard product input will get the inputs for each product and will return it to the
     # the given create_product() function
     name_not_string = False
     price_not_float = False
@@ -425,87 +720,116 @@ def standardProductInputs():  # standard product input will get the inputs for e
     while not id_not_13digInt:
         product_ID = input("Insert its ID Number: ")
         product_ID = input_int_formatting(product_ID)
-        id_not_13digInt = product_id_check(product_ID)
+        id_not_13digInt = product_id_check(product_ID, cart)
 
     return product_name, product_price, product_quantity, product_brand, product_ID
 
 
 # main loop
 
-print('The program has started.')
-cart = ShoppingCart()  # initialise shopping cart for this session
-
-terminated = False
-while not terminated:  # continue to run as long as terminated hasn't been switched to true
-    c = input("Insert your next command (H for help): ")
-    c = c.upper()  # format for comparison reasons
-
-    if c == "A":  # allow the user to add a product to the cart
-        create_product()
-
-    elif c == "R":  # allow the user to remove an item
-        if cart.checkListLength() == 0:  # if there are no items we cannot remove anything
-            print("There are no items to remove.")
-        else:  # otherwise check inputs and if the id number exists in the cart and is valid, remove product from cart
-            input_valid = False
-            product_exists = False
-            while (not input_valid) and (not product_exists):
-                product_to_remove = input("What product would you like to remove [ID number]: ")
-                product_to_remove = input_int_formatting(product_to_remove)
-                input_valid = product_id_check(product_to_remove)
-                product_exists = cart.checkProductExist(product_to_remove)
-
-            cart.removeProduct(product_to_remove)
-
-    elif c == "S":  # allow the user to show the shopping cart
-        if len(cart.cart_list) > 0:  # as long as the cart list has an object return summary
-            cart.getContents()
-        else:
-            print("There are no items in the cart. To add items select 'A'.")
+def run_interactive(cart):  # the interactive session, reading one command at a time from the user
+    terminated = False
+    while not terminated:  # continue to run as long as terminated hasn't been switched to true
+        c = input("Insert your next command (H for help): ")
+        c = c.upper()  # format for comparison reasons
+
+        if c == "A":  # allow the user to add a product to the cart
+            create_product(cart)
+
+        elif c == "R":  # allow the user to remove an item
+            if cart.checkListLength() == 0:  # if there are no items we cannot remove anything
+                print("There are no items to remove.")
+            else:  # otherwise check inputs and if the id number exists in the cart and is valid, remove product from cart
+                input_valid = False
+                product_exists = False
+                while (not input_valid) and (not product_exists):
+                    product_to_remove = input("What product would you like to remove [ID number]: ")
+                    product_to_remove = input_int_formatting(product_to_remove)
+                    input_valid = product_id_check(product_to_remove, cart)
+                    product_exists = cart.checkProductExist(product_to_remove)
+
+                cart.removeProduct(product_to_remove)
+
+        elif c == "S":  # allow the user to show the shopping cart
+            if cart.checkListLength() > 0:  # as long as the cart list has an object return summary
+                cart.getContents()
+            else:
+                print("There are no items in the cart. To add items select 'A'.")
 
-    elif c == "Q":  # allow user to change quantity of item
-        if cart.checkListLength() == 0:  # make sure there is an item in the cart
-            print("There are no items to remove.")
+        elif c == "Q":  # allow user to change quantity of item
+            if cart.checkListLength() == 0:  # make sure there is an item in the cart
+                print("There are no items to remove.")
 
-        else:  # if there are items, set input validities to false
-            input_valid = False
-            product_exists = False
-            quantity_is_int = False
+            else:  # if there are items, set input validities to false
+                input_valid = False
+                product_exists = False
+                quantity_is_int = False
 
-            while not input_valid:
-                while not product_exists:  # check input is valid and that the product exists in the cart
-                    product_to_edit = input("What product would you like to edit [ID number]: ")
-                    product_to_edit = input_int_formatting(product_to_edit)
-                    input_valid = product_id_check(product_to_edit)
-                    product_exists = cart.checkProductExist(product_to_edit)
+                while not input_valid:
+                    while not product_exists:  # check input is valid and that the product exists in the cart
+                        product_to_edit = input("What product would you like to edit [ID number]: ")
+                        product_to_edit = input_int_formatting(product_to_edit)
+                        input_valid = product_id_check(product_to_edit, cart)
+                        product_exists = cart.checkProductExist(product_to_edit)
 
-            while not quantity_is_int:  # check that the quantity being changed to is an int
-                new_product_quantity = input("Change the quantity to: ")
-                new_product_quantity = input_int_formatting(new_product_quantity)
-                quantity_is_int = int_check(new_product_quantity)
+                while not quantity_is_int:  # check that the quantity being changed to is an int
+                    new_product_quantity = input("Change the quantity to: ")
+                    new_product_quantity = input_int_formatting(new_product_quantity)
+                    quantity_is_int = int_check(new_product_quantity)
 
-            if new_product_quantity > 0:  # as long as the new product quantity is more than 0 then change the quantity
-                cart.changeProductQuantity(product_to_edit, new_product_quantity)
+                if new_product_quantity > 0:  # as long as the new product quantity is more than 0 then change the quantity
+                    cart.changeProductQuantity(product_to_edit, new_product_quantity)
 
-    elif c == "E":  # generates a summary of the cart as a JSON formatted data dump
-        file_name = input("Please enter a file name: ")  # filename to save as
-        json_file = {}
-        for item in cart.cart_list:  # dump each item to json
-            json_file[item.name] = json.dumps(item.to_json())
+        elif c == "E":  # generates a summary of the cart as a JSON formatted data dump
+            file_name = input("Please enter a file name: ")  # filename to save as
+            export_cart(cart, "{}.json".format(file_name))  # stream each product into the file as a JSON array
 
-        data = json.dumps(json_file)  # store dump
-        with open("{}.json".format(file_name), "w") as f:
-            f.write(data)  # write to json
+        elif c == "T":  # terminate script
+            terminated = True
 
-    elif c == "T":  # terminate script
-        terminated = True
+        elif c == "H":  # print help
+            print_help()
 
-    elif c == "H":  # print help
-        print_help()
+        else:
+            print("Command not recognised. Please try again.")
+
+
+
+"""
+run function will start the program. With no arguments it runs the interactive session, and with
+--batch <file> it runs the commands in an NDJSON file through the command engine without any prompts,
+printing one JSON result per command. --merge unique_id or --merge variant makes the cart merge
+repeated products into one line
+"""
+
+
+def run(argv):
+    for flag in ("--merge", "--batch"):
+        if flag in argv and argv.index(flag) + 1 == len(argv):  # the flag is missing its value
+            print("Usage: main.py [--merge {}] [--batch <file>]".format(" | ".join(MERGE_KEYS)))
+            return
+    merge_key = None
+    if "--merge" in argv:
+        merge_key = argv[argv.index("--merge") + 1]
+        if merge_key not in MERGE_KEYS:
+            print("--merge must be one of {}".format(", ".join(MERGE_KEYS)))
+            return
+    cart = ShoppingCart(merge_key=merge_key)  # initialise shopping cart for this session
+
+    if "--batch" in argv:
+        from commands import run_command_file  # imported here as the command engine imports main
+
+        cart, replies = run_command_file(argv[argv.index("--batch") + 1], cart)
+        for reply in replies:
+            print(json.dumps(reply))
+        return
+    print('The program has started.')
+    run_interactive(cart)
+    print('Goodbye.')
 
-    else:
-        print("Command not recognised. Please try again.")
 
-print('Goodbye.')
+if __name__ == "__main__":  # only run the program when main.py is run as a script
+    import main  # run the importable module so other modules share its classes rather than copies from __main__
+    main.run(sys.argv[1:])
 
 # End of Code
@@ -0,0 +1,167 @@
+# imports
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+from main import Clothing, Food, Toys, to_money
+
+"""
+Rule based pricing for shopping carts. A PricingEngine holds promotions (multi-buys and percentage
+discounts, limited to a product type and/or a brand) and a tax rate per product type. The rules which
+apply to each (type, brand) pair are compiled once into a lookup table, and the price of each line is
+cached on (unique id, quantity, price, type, brand, rule-set version), so pricing a line already seen is a
+dict lookup.
+
+CartPricing follows one cart through its change listener: adding, removing or changing the quantity
+of a line reprices that line only and adjusts the cart totals, so totals() never walks the cart unless
+the rules have changed since the last time.
+
+Prices are tax exclusive. For each line the multi-buy is applied first, then every percentage discount
+in turn, the net is rounded to the penny and tax is added at the rate for its type, also rounded.
+"""
+
+PENNY = Decimal("0.01")
+DEFAULT_TAX_RATES = {Clothing: Decimal(20), Food: Decimal(0), Toys: Decimal(20)}  # percentages
+MAX_CACHED_LINES = 1000000
+
+LinePrice = namedtuple("LinePrice", ["unique_id", "quantity", "gross", "discount", "net", "tax", "total"])
+
+
+def _penny(amount):
+    return amount.quantize(PENNY, rounding=ROUND_HALF_UP)
+
+
+class MultiBuy:  # buy `buy` units and only pay for `pay` of them, e.g. 3 for 2
+    def __init__(self, buy, pay, kind=None, brand=None):
+        if not 0 <= pay < buy:
+            raise ValueError("a multi-buy must pay for fewer units than are bought")
+        self.buy = buy
+        self.pay = pay
+        self.kind = kind  # None means any product type
+        self.brand = brand  # None means any brand
+
+    def free_units(self, quantity):
+        return (quantity // self.buy) * (self.buy - self.pay)
+
+
+class Discount:  # a percentage off, e.g. Discount(10, brand="Acme") or Discount(5, kind=Food)
+    def __init__(self, percent, kind=None, brand=None):
+        if not 0 < percent <= 100:
+            raise ValueError("a discount must be between 0 and 100 percent")
+        self.percent = to_money(percent)
+        self.kind = kind
+        self.brand = brand
+
+
+def _applies(rule, kind, brand):
+    return rule.kind in (None, kind) and rule.brand in (None, brand)
+
+
+class PricingEngine:
+    def __init__(self, rules=(), tax_rates=None):
+        self.version = 0
+        self.set_rules(rules, tax_rates)
+
+    """
+    set_rules method will replace the promotions and tax rates. The rule-set version goes up, so every
+    line priced under the old rules will be priced again when it is next asked for
+    """
+
+    def set_rules(self, rules, tax_rates=None):
+        self.rules = list(rules)
+        self.tax_rates = dict(DEFAULT_TAX_RATES if tax_rates is None else tax_rates)
+        self.version = self.version + 1
+        self._compiled = {}  # (type, brand) -> (multi-buy or None, price multiplier, tax rate)
+        self._lines = {}  # (unique id, quantity, price, type, brand, version) -> LinePrice
+
+    def _compile(self, kind, brand):  # the combined effect of every rule for one product type and brand
+        multi_buys = [r for r in self.rules if isinstance(r, MultiBuy) and _applies(r, kind, brand)]
+        best = None
+        if multi_buys:  # only the most generous multi-buy is used
+            best = max(multi_buys, key=lambda r: Decimal(r.buy - r.pay) / r.buy)
+        multiplier = Decimal(1)
+        for rule in self.rules:
+            if isinstance(rule, Discount) and _applies(rule, kind, brand):
+                multiplier = multiplier * (100 - rule.percent) / 100
+        compiled = (best, multiplier, to_money(self.tax_rates.get(kind, 0)) / 100)
+        self._compiled[(kind, brand)] = compiled
+        return compiled
+
+    def price_line(self, p):  # the LinePrice of a product, from the cache when it has been priced before
+        kind = type(p)
+        # the type and brand decide which rules apply, so an id reused by another product is priced again
+        key = (p.unique_id, p.quantity, p.price, kind, p.brand, self.version)
+        line = self._lines.get(key)
+        if line is not None:
+            return line
+        compiled = self._compiled.get((kind, p.brand)) or self._compile(kind, p.brand)
+        multi_buy, multiplier, tax_rate = compiled
+        price = to_money(p.price)
+        gross = p.quantity * price
+        charged = p.quantity - multi_buy.free_units(p.quantity) if multi_buy is not None else p.quantity
+        net = _penny(charged * price * multiplier)
+        tax = _penny(net * tax_rate)
+        line = LinePrice(p.unique_id, p.quantity, gross, gross - net, net, tax, net + tax)
+        if len(self._lines) >= MAX_CACHED_LINES:  # keep the cache from growing without limit
+            self._lines.clear()
+        self._lines[key] = line
+        return line
+
+    def price_cart(self, cart):  # a LinePrice for every line of the cart, and their totals
+        lines = [self.price_line(p) for p in cart.getProducts()]
+        return lines, _sum_lines(lines)
+
+
+def _sum_lines(lines):
+    totals = {"gross": Decimal(0), "discount": Decimal(0), "net": Decimal(0), "tax": Decimal(0),
+              "total": Decimal(0)}
+    for line in lines:
+        _add_line(totals, line, 1)
+    return totals
+
+
+def _add_line(totals, line, sign):
+    totals["gross"] = totals["gross"] + sign * line.gross
+    totals["discount"] = totals["discount"] + sign * line.discount
+    totals["net"] = totals["net"] + sign * line.net
+    totals["tax"] = totals["tax"] + sign * line.tax
+    totals["total"] = totals["total"] + sign * line.total
+
+
+# the priced view of one cart, kept up to date a line at a time through the cart's listener
+class CartPricing:
+    def __init__(self, cart, engine):
+        self.cart = cart
+        self.engine = engine
+        self._lines = {}
+        self._totals = None
+        self._version = None
+        cart.addListener(self._changed)
+
+    def close(self):  # stop following the cart
+        self.cart.removeListener(self._changed)
+
+    def _refresh(self):  # price every line again, only needed when the rules have changed
+        self._lines = {p.unique_id: self.engine.price_line(p) for p in self.cart.getProducts()}
+        self._totals = _sum_lines(self._lines.values())
+        self._version = self.engine.version
+
+    def _changed(self, event, p):
+        if self._version != self.engine.version:
+            return  # everything is repriced on the next call anyway
+        old = self._lines.pop(p.unique_id, None)
+        if old is not None:
+            _add_line(self._totals, old, -1)
+        if event != "remove":
+            line = self.engine.price_line(p)
+            self._lines[p.unique_id] = line
+            _add_line(self._totals, line, 1)
+
+    def line(self, unique_id):
+        if self._version != self.engine.version:
+            self._refresh()
+        return self._lines.get(unique_id)
+
+    def totals(self):  # gross, discount, net, tax and total of the whole cart
+        if self._version != self.engine.version:
+            self._refresh()
+        return dict(self._totals)
@@ -0,0 +1,117 @@
+# imports
+from array import array
+
+from main import Clothing, Food, Toys
+
+"""
+A compact columnar store for very large numbers of products, for example catalog-sized carts used in
+pricing simulations. Prices, quantities and ids are held in typed arrays, while names, brands and the
+type-specific attributes are pooled so repeated values are only stored once.
+Rows are read back through ProductRow views, which only hold the table and a row number.
+"""
+
+PRODUCT_KINDS = (Clothing, Food, Toys)  # the position in this tuple is the kind code stored for each row
+
+
+class ProductTable:
+    def __init__(self):
+        self.kind = array("b")  # index into PRODUCT_KINDS
+        self.price = array("d")
+        self.quantity = array("q")
+        self.unique_id = array("q")  # 13 digit ids fit comfortably in 64 bits
+        self.name = array("l")  # the following three columns are indexes into the value pool
+        self.brand = array("l")
+        self.extra = array("l")  # the type-specific attributes of the row as one pooled tuple
+        self._pool = []  # each distinct name, brand or extra tuple is stored once in here
+        self._pool_index = {}
+
+    def _intern(self, value):  # return the pool index of value, adding it to the pool if it is new
+        index = self._pool_index.get(value)
+        if index is None:
+            index = len(self._pool)
+            self._pool.append(value)
+            self._pool_index[value] = index
+        return index
+
+    """
+    add method will append a row to the table from its raw values, the extra values being the
+    type-specific attributes in the order the product class takes them (e.g. size, materials for Clothing)
+    """
+
+    def add(self, kind, name, price, quantity, brand, unique_id, *extra):
+        self.kind.append(PRODUCT_KINDS.index(kind))
+        self.price.append(price)
+        self.quantity.append(quantity)
+        self.unique_id.append(unique_id)
+        self.name.append(self._intern(name))
+        self.brand.append(self._intern(brand))
+        self.extra.append(self._intern(extra))
+
+    def append(self, p):  # append a row from an existing Clothing, Food or Toys object
+        extra = [getattr(p, field) for field in type(p).__slots__]
+        self.add(type(p), p.name, p.price, p.quantity, p.brand, p.unique_id, *extra)
+
+    def __len__(self):
+        return len(self.kind)
+
+    def __getitem__(self, i):  # a lightweight view of row i
+        if i < 0:
+            i = i + len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("row {} is out of range".format(i))
+        return ProductRow(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield ProductRow(self, i)
+
+    def total(self):  # total cost of every row worked out straight from the columns
+        return sum(p * q for p, q in zip(self.price, self.quantity))
+
+
+# a read-only view of a single row in a ProductTable, which can be turned back into a product when needed
+class ProductRow:
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    @property
+    def kind(self):
+        return PRODUCT_KINDS[self._table.kind[self._index]]
+
+    @property
+    def name(self):
+        return self._table._pool[self._table.name[self._index]]
+
+    @property
+    def price(self):
+        return self._table.price[self._index]
+
+    @property
+    def quantity(self):
+        return self._table.quantity[self._index]
+
+    @property
+    def brand(self):
+        return self._table._pool[self._table.brand[self._index]]
+
+    @property
+    def unique_id(self):
+        return self._table.unique_id[self._index]
+
+    def __getattr__(self, attribute):  # type-specific attributes such as size or expiry_date
+        if attribute.startswith("_"):  # never look up private names through the table
+            raise AttributeError(attribute)
+        fields = self.kind.__slots__
+        if attribute in fields:
+            return self._table._pool[self._table.extra[self._index]][fields.index(attribute)]
+        raise AttributeError(attribute)
+
+    def to_product(self):  # build a full Clothing, Food or Toys object from the row
+        extra = self._table._pool[self._table.extra[self._index]]
+        return self.kind(self.name, self.price, self.quantity, self.brand, self.unique_id, *extra)
+
+    def to_json(self):
+        return self.to_product().to_json()
@@ -0,0 +1,127 @@
+# imports
+import os
+import stat
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+import binary_cart
+from binary_cart import BinaryCart, write_binary_cart
+from main import ShoppingCart, Clothing, Food, Toys
+
+FIRST_ID = 1000000000000
+
+
+def make_cart():
+    cart = ShoppingCart()
+    cart.addProduct(Clothing("Shirt", 9.99, 2, "Acme", FIRST_ID + 5, "M", "Cotton"))
+    cart.addProduct(Food("Bread", 1.25, 3, "Bakery", FIRST_ID + 1, datetime(2099, 1, 1), True, False))
+    cart.addProduct(Food("Tofu", 2.5, 1, "Acme", FIRST_ID + 9, datetime(2098, 6, 30), False, True))
+    cart.addProduct(Toys("Ball", 3.5, 4, "Toyco", FIRST_ID + 3, 5, "M"))
+    cart.addProduct(Clothing("Scarf", 12.0, 1, "Woolly", FIRST_ID, "S", "Wool"))
+    return cart
+
+
+def fields(p):  # everything about a product, for comparing the ones read back with the originals
+    return (type(p), p.name, p.price, p.quantity, p.brand, p.unique_id) + tuple(
+        getattr(p, name) for name in type(p).__slots__ if not name.startswith("_"))
+
+
+# every test runs on the plain struct path and, when NumPy is installed, on the column path too
+@pytest.fixture(params=["records", "columns"])
+def binary(request, tmp_path):
+    if request.param == "columns" and binary_cart.np is None:
+        pytest.skip("NumPy is not installed")
+    path = str(tmp_path / "cart.bin")
+    write_binary_cart(make_cart(), path)
+    opened = BinaryCart(path)
+    if request.param == "records":
+        opened._records = None
+    yield opened
+    opened.close()
+
+
+def test_round_trip_every_product_type(binary):
+    expected = [fields(p) for p in make_cart().getProducts()]
+    assert len(binary) == len(expected)
+    assert [fields(p) for p in binary.products()] == expected
+    assert set(type(p) for p in binary.products()) == {Clothing, Food, Toys}
+
+
+def test_totals(binary):
+    assert binary.totals() == make_cart().totals()
+    assert binary.totals()["subtotal"] == Decimal("52.23")
+
+
+def test_find(binary):
+    for line, p in enumerate(make_cart().getProducts()):
+        assert binary.find(p.unique_id) == line
+    for missing in (FIRST_ID - 1, FIRST_ID + 2, FIRST_ID + 10, 0):
+        assert binary.find(missing) is None
+
+
+def test_select_each_filter(binary):
+    assert binary.select() == [0, 1, 2, 3, 4]
+    assert binary.select(kind=Clothing) == [0, 4]
+    assert binary.select(kind=Food) == [1, 2]
+    assert binary.select(kind=Toys) == [3]
+    assert binary.select(brand="Acme") == [0, 2]
+    assert binary.select(brand="Nobody") == []
+    assert binary.select(gluten_free=True) == [1]
+    assert binary.select(gluten_free=False) == [2]
+    assert binary.select(suitable_for_vegans=True) == [2]
+    assert binary.select(suitable_for_vegans=False) == [1]
+    assert binary.select(max_price=3.5) == [1, 2, 3]
+    assert binary.select(kind=Food, brand="Acme", max_price=5) == [2]
+
+
+def test_empty_cart(tmp_path):
+    path = str(tmp_path / "empty.bin")
+    write_binary_cart(ShoppingCart(), path)
+    with BinaryCart(path) as opened:
+        assert len(opened) == 0
+        assert opened.find(FIRST_ID) is None
+        assert opened.select(kind=Food) == []
+        assert opened.totals()["units"] == 0
+
+
+def test_not_a_binary_cart(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"NOPE" + bytes(64))
+    with pytest.raises(ValueError):
+        BinaryCart(str(path))
+
+
+def test_file_modes(tmp_path):
+    old_umask = os.umask(0o022)
+    try:
+        path = str(tmp_path / "new.bin")
+        write_binary_cart(make_cart(), path)
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644  # as open() would make it
+        os.chmod(path, 0o640)
+        write_binary_cart(make_cart(), path)
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o640  # the mode of the file replaced is kept
+    finally:
+        os.umask(old_umask)
+    assert os.listdir(str(tmp_path)) == ["new.bin"]  # no temporary file is left behind
+
+
+def test_select_price_bound_is_rounded_down(binary):
+    assert binary.select(max_price=0.1 + 0.2) == []  # more than 6 decimal places
+    assert binary.select(max_price=2.4999999) == [1]
+    assert binary.select(max_price=3.5000001) == [1, 2, 3]
+    assert binary.select(max_price=10 ** 30) == [0, 1, 2, 3, 4]
+
+
+def test_totals_too_big_for_int64(tmp_path):
+    cart = ShoppingCart()
+    cart.addProduct(Toys("Yacht", 999999.999999, 2 ** 40, "Boatco", FIRST_ID, 18, "F"))
+    cart.addProduct(Toys("Ship", 888888.5, 2 ** 40, "Boatco", FIRST_ID + 1, 18, "M"))
+    path = str(tmp_path / "big.bin")
+    write_binary_cart(cart, path)
+    with BinaryCart(path) as opened:
+        assert opened.totals() == cart.totals()
+        if opened._records is not None:
+            opened._records = None  # and the same on the struct path
+            assert opened.totals() == cart.totals()
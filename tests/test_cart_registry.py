@@ -0,0 +1,118 @@
+# imports
+import pytest
+
+from cart_registry import CartRegistry
+from main import Toys
+
+FIRST_ID = 1000000000000
+
+
+def toy(unique_id, quantity=1):
+    return Toys("Ball", 3.5, quantity, "Toyco", unique_id, 3, "M")
+
+
+def fill(registry, customer_id, lines):  # give a customer a cart of lines products
+    with registry.using(customer_id) as cart:
+        cart.addMany([toy(FIRST_ID + customer_id * 100 + i) for i in range(lines)])
+
+
+def ids(registry, customer_id):
+    with registry.using(customer_id) as cart:
+        return list(cart.getIds())
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = CartRegistry(str(tmp_path), shards=1, max_carts=2)
+    yield registry
+    registry.close()
+
+
+def test_counters(registry):
+    fill(registry, 1, 1)
+    assert registry.stats()["created"] == 1
+    ids(registry, 1)
+    stats = registry.stats()
+    assert (stats["hits"], stats["misses"], stats["created"]) == (1, 0, 1)
+    assert stats["hit_rate"] == 0.5
+    assert (stats["hot_carts"], stats["hot_lines"]) == (1, 1)
+
+
+def test_least_recently_used_cart_is_spilled_and_reloaded(registry):
+    fill(registry, 1, 2)
+    fill(registry, 2, 1)
+    ids(registry, 1)  # 2 is now the least recently used
+    fill(registry, 3, 1)
+    stats = registry.stats()
+    assert (stats["evictions"], stats["spills"], stats["hot_carts"]) == (1, 1, 2)
+    assert stats["hot_lines"] == 3
+
+    assert ids(registry, 2) == [FIRST_ID + 200]  # loaded back from disk
+    assert registry.stats()["misses"] == 1
+    assert ids(registry, 1) == [FIRST_ID + 100, FIRST_ID + 101]
+
+
+def test_unchanged_carts_are_not_written_again(registry):
+    for customer_id in (1, 2, 3):
+        fill(registry, customer_id, 1)
+    assert registry.stats()["spills"] == 1
+    ids(registry, 1)  # loaded, spilling 2
+    ids(registry, 2)  # loaded, spilling 3
+    ids(registry, 3)  # loaded, spilling 1 which has not changed since it was loaded
+    stats = registry.stats()
+    assert (stats["evictions"], stats["spills"]) == (4, 3)
+
+
+def test_changes_made_while_using_are_kept(registry):
+    fill(registry, 1, 1)
+    with registry.using(1) as cart:
+        for customer_id in (2, 3, 4):  # would spill 1 if it was not in use
+            fill(registry, customer_id, 1)
+        cart.changeProductQuantity(FIRST_ID + 100, 5)
+    assert registry.stats()["hot_carts"] <= 3
+    for customer_id in (5, 6):
+        fill(registry, customer_id, 1)
+    with registry.using(1) as cart:
+        assert cart.getProduct(FIRST_ID + 100).quantity == 5
+
+
+def test_line_limit(tmp_path):
+    registry = CartRegistry(str(tmp_path), shards=1, max_carts=10, max_lines=3)
+    fill(registry, 1, 2)
+    fill(registry, 2, 2)
+    assert registry.stats()["hot_lines"] == 4  # the limits are checked when a cart is next asked for
+    ids(registry, 2)
+    stats = registry.stats()
+    assert (stats["hot_carts"], stats["hot_lines"], stats["evictions"]) == (1, 2, 1)
+    assert ids(registry, 1) == [FIRST_ID + 100, FIRST_ID + 101]
+    registry.close()
+
+
+def test_ttl(tmp_path):
+    registry = CartRegistry(str(tmp_path), shards=1, ttl=0)
+    fill(registry, 1, 1)
+    registry.evict_idle()
+    assert registry.stats()["hot_carts"] == 0
+    assert ids(registry, 1) == [FIRST_ID + 100]
+    registry.close()
+
+
+def test_remove_and_reopen(tmp_path):
+    registry = CartRegistry(str(tmp_path), shards=4, max_carts=8)
+    for customer_id in range(6):
+        fill(registry, customer_id, 2)
+    registry.remove(3)
+    registry.close()
+
+    registry = CartRegistry(str(tmp_path), shards=4, max_carts=8)
+    assert ids(registry, 0) == [FIRST_ID, FIRST_ID + 1]
+    assert ids(registry, 3) == []
+    assert registry.stats()["created"] == 1
+    registry.close()
+
+
+def test_limits_below_the_shard_count(tmp_path):
+    with pytest.raises(ValueError):
+        CartRegistry(str(tmp_path), shards=16, max_carts=10)
+    with pytest.raises(ValueError):
+        CartRegistry(str(tmp_path), shards=16, max_lines=10)
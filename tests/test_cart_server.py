@@ -0,0 +1,96 @@
+# imports
+import asyncio
+import json
+
+from cart_server import CartServer
+
+FIRST_ID = 1000000000000
+TOY = {"type": "Toys", "name": "Ball", "price": 3.5, "quantity": 1, "brand": "Toyco", "unique id": FIRST_ID,
+       "minimum_age": 3, "gender": "M"}
+
+
+class Client:  # one connection to the server, sending a request and reading its reply
+    def __init__(self, reader, writer, greeting):
+        self.reader = reader
+        self.writer = writer
+        self.greeting = greeting
+
+    async def request(self, request):
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+        return await self.read()
+
+    async def read(self):
+        line = await self.reader.readline()
+        return json.loads(line) if line else None
+
+    def close(self):
+        self.writer.close()
+
+
+async def connect(port):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    client = Client(reader, writer, None)
+    client.greeting = await client.read()
+    return client
+
+
+def run_with_server(test, **options):  # run the coroutine test(server, port) against a fresh server
+    async def main():
+        server = CartServer(**options)
+        port = await server.start("127.0.0.1", 0)
+        try:
+            await test(server, port)
+        finally:
+            await server.close()
+    asyncio.run(main())
+
+
+def test_sessions_are_separate():
+    async def test(server, port):
+        first = await connect(port)
+        second = await connect(port)
+        assert first.greeting["session"] != second.greeting["session"]
+        assert (await first.request({"cmd": "A", "products": [TOY]}))["ok"]
+        assert (await second.request({"cmd": "S"}))["lines"] == []
+        assert not (await second.request({"cmd": "J", "token": "guess"}))["ok"]
+        assert not (await second.request({"cmd": "J", "token": first.greeting["session"]}))["ok"]
+        first.close()
+        second.close()
+    run_with_server(test)
+
+
+def test_terminate_only_detaches_one_connection():
+    async def test(server, port):
+        owner = await connect(port)
+        other = await connect(port)
+        assert (await other.request({"cmd": "J", "token": owner.greeting["token"]}))["ok"]
+        assert len(server.sessions) == 1  # the session other left, holding nobody, is gone
+        assert (await owner.request({"cmd": "A", "products": [TOY]}))["ok"]
+        assert (await owner.request({"cmd": "T"}))["ok"]
+        assert await owner.read() is None  # the server closed the connection
+
+        assert len(server.sessions) == 1  # still shared with other
+        assert (await other.request({"cmd": "S"}))["totals"]["lines"] == 1
+        third = await connect(port)
+        assert (await third.request({"cmd": "J", "token": owner.greeting["token"]}))["ok"]
+        assert (await other.request({"cmd": "T"}))["ok"]
+        assert (await third.request({"cmd": "T"}))["ok"]
+        assert len(server.sessions) == 0
+        for client in (owner, other, third):
+            client.close()
+    run_with_server(test)
+
+
+def test_session_limit():
+    async def test(server, port):
+        first = await connect(port)
+        refused = await connect(port)
+        assert not refused.greeting["ok"]
+        assert (await first.request({"cmd": "T"}))["ok"]
+        await first.read()
+        again = await connect(port)
+        assert again.greeting["ok"]
+        for client in (first, refused, again):
+            client.close()
+    run_with_server(test, max_sessions=1)
@@ -0,0 +1,206 @@
+# imports
+import os
+import struct
+import threading
+from datetime import datetime
+
+import pytest
+
+import cart_store
+from cart_store import PersistentCart, HEADER
+from main import Clothing, Food, Toys
+
+FIRST_ID = 1000000000000
+
+
+def make_products():  # a line of every product type, two of them sharing a name
+    return [Clothing("Shirt", 9.99, 1, "Acme", FIRST_ID, "M", "Cotton"),
+            Food("Bread", 1.25, 2, "Bakery", FIRST_ID + 1, datetime(2099, 1, 1), True, False),
+            Toys("Ball", 3.5, 3, "Toyco", FIRST_ID + 2, 5, "M"),
+            Toys("Ball", 4.0, 1, "Toyco", FIRST_ID + 3, 3, "F")]
+
+
+def contents(cart):  # everything about every line, so recovered carts can be compared exactly
+    return [cart_store.product_state(p) for p in cart.getProducts()]
+
+
+def reopen(cart):
+    cart.close()
+    return PersistentCart(cart._journal.folder)
+
+
+def record_offsets(path):  # where each journal record of a segment starts
+    with open(path, "rb") as f:
+        data = f.read()
+    offsets = []
+    offset = 0
+    while offset < len(data):
+        offsets.append(offset)
+        offset = offset + HEADER.size + HEADER.unpack_from(data, offset)[1]
+    return offsets
+
+
+def test_every_product_type_is_recovered(tmp_path):
+    cart = PersistentCart(str(tmp_path))
+    for p in make_products():
+        cart.addProduct(p)
+    expected = contents(cart)
+    cart = reopen(cart)
+    assert contents(cart) == expected
+    food = cart.getProduct(FIRST_ID + 1)
+    assert food.expiry_date == datetime(2099, 1, 1) and food.gluten_free is True
+    assert cart.getProduct(FIRST_ID + 2).minimum_age == 5
+    assert cart.totals() == cart.recomputeTotals()
+    cart.close()
+
+
+def test_remove_and_quantity_by_name_are_replayed(tmp_path):
+    cart = PersistentCart(str(tmp_path))
+    for p in make_products():
+        cart.addProduct(p)
+    cart.changeProductQuantity("Ball", 7)  # both lines named Ball
+    cart.removeProduct("Bread")
+    expected = contents(cart)
+    cart = reopen(cart)
+    assert contents(cart) == expected
+    assert [p.quantity for p in cart.getProductsByName("Ball")] == [7, 7]
+    assert not cart.getProductsByName("Bread")
+    cart.removeProduct("Ball")
+    cart = reopen(cart)
+    assert [p.unique_id for p in cart.getProducts()] == [FIRST_ID]
+    cart.close()
+
+
+def test_recovery_from_snapshot_and_later_journal(tmp_path):
+    cart = PersistentCart(str(tmp_path))
+    for p in make_products():
+        cart.addProduct(p)
+    cart.checkpoint()
+    cart.changeProductQuantity(FIRST_ID, 4)
+    cart.removeProduct(FIRST_ID + 3)
+    expected = contents(cart)
+    cart = reopen(cart)
+    assert contents(cart) == expected
+    cart.close()
+
+
+def _crash_during_checkpoint(cart, monkeypatch):  # fail after the new segment is opened, before the snapshot is replaced
+    def crash(*args):
+        raise OSError("simulated crash")
+    with monkeypatch.context() as m:
+        m.setattr(cart_store.os, "replace", crash)
+        with pytest.raises(OSError):
+            cart.checkpoint()
+
+
+def test_crash_between_new_segment_and_snapshot(tmp_path, monkeypatch):
+    cart = PersistentCart(str(tmp_path))
+    for p in make_products()[:2]:
+        cart.addProduct(p)
+    cart.checkpoint()  # snapshot follows on from segment 2
+    cart.addProduct(make_products()[2])
+    _crash_during_checkpoint(cart, monkeypatch)  # segment 3 is open, the snapshot still points at 2
+    cart.changeProductQuantity(FIRST_ID, 6)  # journalled to segment 3
+    expected = contents(cart)
+    cart.close()
+    assert cart._journal.segments() == [2, 3]
+
+    cart = PersistentCart(str(tmp_path))
+    assert contents(cart) == expected
+    cart.close()
+
+
+def test_torn_record_in_the_middle_stops_replay(tmp_path, monkeypatch):
+    cart = PersistentCart(str(tmp_path))
+    products = make_products()
+    cart.addProduct(products[0])
+    cart.addProduct(products[1])
+    expected = contents(cart)
+    cart.addProduct(products[2])  # this record will be damaged
+    cart.changeProductQuantity(FIRST_ID + 2, 9)  # depends on the damaged record
+    _crash_during_checkpoint(cart, monkeypatch)
+    cart.addProduct(products[3])  # in the next segment, after the damage
+    cart.close()
+
+    first = os.path.join(str(tmp_path), "journal-000001.log")
+    offsets = record_offsets(first)
+    with open(first, "r+b") as f:  # flip a payload byte of the third record
+        f.seek(offsets[2] + HEADER.size + 3)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    cart = PersistentCart(str(tmp_path))
+    assert contents(cart) == expected  # nothing after the damage is replayed, not even later segments
+    assert cart._journal.segments() == [1]
+    assert os.path.getsize(first) == offsets[2]
+
+    cart.addProduct(products[3])  # new records follow the last valid one and survive the next recovery
+    expected = contents(cart)
+    cart = reopen(cart)
+    assert contents(cart) == expected
+    cart.close()
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    cart = PersistentCart(str(tmp_path))
+    for p in make_products():
+        cart.addProduct(p)
+    expected = contents(cart)
+    cart.close()
+    with open(os.path.join(str(tmp_path), "journal-000001.log"), "ab") as f:  # a header cut short by a crash
+        f.write(b"\x03\x10\x00")
+    cart = PersistentCart(str(tmp_path))
+    assert contents(cart) == expected
+    cart.close()
+
+
+def test_restore_an_in_memory_snapshot(tmp_path):
+    cart = PersistentCart(str(tmp_path))
+    products = make_products()
+    for p in products[:3]:
+        cart.addProduct(p)
+    before = contents(cart)
+    s = cart.snapshot()  # the CartSnapshot of ShoppingCart, not checkpoint()
+    cart.changeProductQuantity(FIRST_ID, 5)
+    cart.removeProduct(FIRST_ID + 1)
+    cart.removeProduct(FIRST_ID + 2)
+    cart.addProduct(Toys("Kite", 8.0, 3, "Skyco", FIRST_ID + 2, 8, "F"))  # the id used again by another product
+    cart.addProduct(products[3])
+    cart.restore(s)
+    s.close()
+    assert contents(cart) == before
+    cart = reopen(cart)  # the restore was journalled
+    assert contents(cart) == before
+    cart.close()
+
+
+def test_a_change_which_cannot_be_journalled_leaves_the_cart_alone(tmp_path):
+    cart = PersistentCart(str(tmp_path))
+    for p in make_products():
+        cart.addProduct(p)
+    expected = contents(cart)
+    with pytest.raises(struct.error):
+        cart.changeProductQuantity(FIRST_ID, 2 ** 63)  # too big for the record
+    with pytest.raises(struct.error):
+        cart.changeProductQuantity("Ball", 2 ** 63)
+    assert contents(cart) == expected
+    assert cart.totals() == cart.recomputeTotals()
+    cart = reopen(cart)
+    assert contents(cart) == expected
+    cart.close()
+
+
+def test_idle_records_are_synced_by_the_timer(tmp_path, monkeypatch):
+    synced = threading.Event()
+    fsync = os.fsync
+
+    def recording_fsync(fd):
+        fsync(fd)
+        synced.set()
+    monkeypatch.setattr(cart_store.os, "fsync", recording_fsync)
+    cart = PersistentCart(str(tmp_path), sync_every=1000, sync_interval=0.01)
+    cart.addProduct(make_products()[0])  # no record follows it
+    assert synced.wait(5)
+    assert cart._journal._unsynced == 0
+    cart.close()
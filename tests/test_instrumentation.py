@@ -0,0 +1,45 @@
+# imports
+import instrumentation
+from cart_store import PersistentCart
+from instrumentation import Metrics, instrumented
+from main import ShoppingCart, Toys
+
+FIRST_ID = 1000000000000
+
+
+def toy(unique_id):
+    return Toys("Ball", 3.5, 2, "Toyco", unique_id, 3, "M")
+
+
+def counts(metrics):
+    return {name: operation["count"] for name, operation in metrics.snapshot()["operations"].items()}
+
+
+def test_operations_are_counted_and_gauges_set():
+    metrics = Metrics()
+    with instrumented(metrics):
+        cart = ShoppingCart()
+        cart.addProduct(toy(FIRST_ID))
+        cart.addProduct(toy(FIRST_ID + 1))
+        cart.changeProductQuantity(FIRST_ID, 5)
+        ShoppingCart().addProduct(toy(FIRST_ID))  # the gauges follow the cart changed last
+    assert counts(metrics) == {"addProduct": 3, "changeProductQuantity": 1}
+    gauges = metrics.snapshot()["gauges"]
+    assert (gauges["last_cart_lines"], gauges["last_cart_units"], gauges["cart_lines_max"]) == (1, 2, 2)
+    assert "last_cart_lines 1" in metrics.prometheus_text()
+
+
+def test_subclass_overrides_are_timed_once(tmp_path):
+    original = PersistentCart.addProduct
+    metrics = Metrics()
+    with instrumented(metrics):
+        assert PersistentCart.addProduct is not original  # the journalling override is timed
+        cart = PersistentCart(str(tmp_path))
+        cart.addProduct(toy(FIRST_ID))
+        cart.addProduct(toy(FIRST_ID + 1))
+        cart.removeProduct("Ball")  # both lines, each through super().removeProduct
+        cart.close()
+    assert counts(metrics) == {"addProduct": 2, "removeProduct": 1}
+    assert PersistentCart.addProduct is original
+    assert not hasattr(ShoppingCart.addProduct, "__wrapped__")  # disable put the originals back
+    assert not instrumentation.enabled()
@@ -0,0 +1,91 @@
+# imports
+from datetime import datetime
+
+import pytest
+
+from cart_import import add_records
+from main import ShoppingCart, Clothing, Food, Toys
+
+FIRST_ID = 1000000000000
+EXPIRY = datetime(2099, 1, 1)
+
+
+def toy_record(unique_id, quantity, minimum_age=3):
+    return {"type": "Toys", "name": "Ball", "price": 3.5, "quantity": quantity, "brand": "Toyco",
+            "unique id": unique_id, "minimum_age": minimum_age, "gender": "M"}
+
+
+def test_variant_merges_identical_products():
+    cart = ShoppingCart(merge_key="variant")
+    first = Clothing("Shirt", 9.99, 1, "Acme", FIRST_ID, "M", "Cotton")
+    line = cart.addProduct(first)
+    assert cart.addProduct(Clothing("Shirt", 9.99, 2, "Acme", FIRST_ID + 1, "M", "Cotton")) is line
+    assert cart.number_of_products == 1
+    assert line.quantity == 3
+    assert cart.totals() == cart.recomputeTotals()
+
+
+def test_variant_keeps_every_field():
+    cart = ShoppingCart(merge_key="variant")
+    cart.addProduct(Toys("Ball", 3.5, 1, "Toyco", FIRST_ID, 3, "M"))
+    cart.addProduct(Toys("Ball", 3.5, 1, "Toyco", FIRST_ID + 1, 12, "M"))
+    cart.addProduct(Toys("Ball", 3.5, 1, "Toyco", FIRST_ID + 2, 3, "F"))
+    cart.addProduct(Food("Bread", 1.25, 1, "Bakery", FIRST_ID + 3, EXPIRY, True, False))
+    cart.addProduct(Food("Bread", 1.25, 1, "Bakery", FIRST_ID + 4, EXPIRY, False, False))
+    cart.addProduct(Food("Bread", 1.25, 1, "Bakery", FIRST_ID + 5, EXPIRY, True, True))
+    cart.addProduct(Clothing("Shirt", 9.99, 1, "Acme", FIRST_ID + 6, "M", "Cotton"))
+    cart.addProduct(Clothing("Shirt", 9.99, 1, "Acme", FIRST_ID + 7, "L", "Cotton"))
+    cart.addProduct(Clothing("Shirt", 9.99, 1, "Acme", FIRST_ID + 8, "M", "Linen"))
+    assert cart.number_of_products == 9
+    assert [p.unique_id for p in cart.query(minimum_age=12)] == [FIRST_ID + 1]
+    assert [p.unique_id for p in cart.query(gender="F")] == [FIRST_ID + 2]
+    assert [p.unique_id for p in cart.query(gluten_free=False)] == [FIRST_ID + 4]
+
+
+def test_variant_add_many():
+    products = [Toys("Ball", 3.5, 1, "Toyco", FIRST_ID, 3, "M"),
+                Toys("Ball", 3.5, 2, "Toyco", FIRST_ID + 1, 3, "M"),
+                Toys("Ball", 3.5, 4, "Toyco", FIRST_ID + 2, 12, "M"),
+                Toys("Ball", 3.5, 8, "Toyco", FIRST_ID + 3, 3, "M")]
+    cart = ShoppingCart(merge_key="variant")
+    assert cart.addMany(products) == 2
+    assert [(p.unique_id, p.quantity) for p in cart.getProducts()] == [(FIRST_ID, 11), (FIRST_ID + 2, 4)]
+    assert [p.quantity for p in products] == [1, 2, 4, 8]  # the products given are left as they were
+    assert cart.addMany([Toys("Ball", 3.5, 5, "Toyco", FIRST_ID + 4, 12, "M")]) == 0
+    assert cart.getProduct(FIRST_ID + 2).quantity == 9
+    assert cart.totals() == cart.recomputeTotals()
+
+
+def test_unique_id_merging():
+    cart = ShoppingCart(merge_key="unique_id")
+    assert cart.mergesIds()
+    cart.addProduct(Toys("Ball", 3.5, 1, "Toyco", FIRST_ID, 3, "M"))
+    cart.addProduct(Toys("Ball", 3.5, 2, "Toyco", FIRST_ID, 3, "M"))
+    products = [Toys("Ball", 3.5, 4, "Toyco", FIRST_ID, 3, "M"), Toys("Kite", 8.0, 1, "Skyco", FIRST_ID + 1, 8, "F"),
+                Toys("Kite", 8.0, 2, "Skyco", FIRST_ID + 1, 8, "F")]
+    assert cart.addMany(products) == 1
+    assert [(p.unique_id, p.quantity) for p in cart.getProducts()] == [(FIRST_ID, 7), (FIRST_ID + 1, 3)]
+    assert [p.quantity for p in products] == [4, 1, 2]
+    assert cart.totals() == cart.recomputeTotals()
+
+
+def test_import_repeated_ids():
+    records = [toy_record(FIRST_ID, 1), toy_record(FIRST_ID, 2), toy_record(FIRST_ID + 1, 1)]
+    merging = ShoppingCart(merge_key="unique_id")
+    assert not add_records(merging, records).errors
+    assert not add_records(merging, [toy_record(FIRST_ID, 4)]).errors  # an id already in the cart
+    assert [(p.unique_id, p.quantity) for p in merging.getProducts()] == [(FIRST_ID, 7), (FIRST_ID + 1, 1)]
+
+    plain = ShoppingCart()
+    result = add_records(plain, records)
+    assert [e.line for e in result.errors] == [2]
+    assert [e.line for e in add_records(plain, [toy_record(FIRST_ID, 4)]).errors] == [1]
+    assert plain.number_of_products == 2
+
+
+def test_plain_cart_rejects_a_repeated_id():
+    cart = ShoppingCart()
+    assert not cart.mergesIds()
+    cart.addProduct(Toys("Ball", 3.5, 1, "Toyco", FIRST_ID, 3, "M"))
+    with pytest.raises(ValueError):
+        cart.addProduct(Toys("Ball", 3.5, 1, "Toyco", FIRST_ID, 3, "M"))
@@ -0,0 +1,88 @@
+# imports
+from datetime import datetime
+
+import pytest
+
+import validation
+from commands import execute
+from main import ShoppingCart
+from validation import (validate_prices, validate_quantities, validate_ids, validate_sizes, validate_genders,
+                        validate_types, validate_text, validate_bools, validate_expiry_dates, combine_masks)
+
+FIRST_ID = 1000000000000
+
+
+# every test runs without NumPy and, when it is installed, with it
+@pytest.fixture(params=["python", "numpy"], autouse=True)
+def numpy_path(request, monkeypatch):
+    if request.param == "numpy" and validation.np is None:
+        pytest.skip("NumPy is not installed")
+    if request.param == "python":
+        monkeypatch.setattr(validation, "np", None)
+    return request.param
+
+
+def rows(result):  # the rows of a ColumnResult which are not valid
+    return [e.row for e in result.errors]
+
+
+def test_prices():
+    result = validate_prices([2, 3.5, "4.25", 0, -1, "abc", None, True, [1]])
+    assert result.values[:3] == [2.0, 3.5, 4.25]
+    assert rows(result) == [3, 4, 5, 6, 7, 8]
+    assert list(result.mask) == [True, True, True] + [False] * 6
+
+
+def test_prices_must_be_finite():
+    assert rows(validate_prices([10 ** 400, 1.5])) == [0]
+    assert rows(validate_prices([float("inf"), 1.5])) == [0]
+    assert rows(validate_prices([float("nan"), 1.5])) == [0]
+    assert rows(validate_prices(["inf", "-inf", "nan", "1e400", "1.5"])) == [0, 1, 2, 3]
+
+
+def test_quantities():
+    result = validate_quantities([1, "2", 0, -3, 1.5, "x", True])
+    assert result.values[:2] == [1, 2]
+    assert rows(result) == [2, 3, 4, 5, 6]
+    assert rows(validate_quantities([True, 1])) == [0]
+
+
+def test_ids():
+    result = validate_ids([FIRST_ID, str(FIRST_ID + 1), FIRST_ID, 123, "x", True])
+    assert result.values[:2] == [FIRST_ID, FIRST_ID + 1]
+    assert rows(result) == [2, 3, 4, 5]
+    assert rows(validate_ids([FIRST_ID, FIRST_ID + 1], existing={FIRST_ID + 1})) == [1]
+    assert rows(validate_ids([FIRST_ID, FIRST_ID], repeats=True)) == []
+
+
+def test_choices():
+    assert validate_sizes([" m ", "xl", "huge", 3]).values == ["M", "XL", None, None]
+    assert validate_genders(["m", "F", "x"]).values == ["M", "F", None]
+    assert rows(validate_types(["Food", "Toys", "food", None])) == [2, 3]
+
+
+def test_text_and_bools():
+    assert rows(validate_text(["Ball", "", "  ", None, 3], "name")) == [1, 2, 3, 4]
+    result = validate_bools([True, False, "yes", "No", "maybe", 1], "gluten free")
+    assert result.values == [True, False, True, False, None, None]
+
+
+def test_expiry_dates():
+    today = datetime(2030, 6, 15)
+    result = validate_expiry_dates(["16/06/2030", "15/06/2030", "14/06/2030", "2030-06-16", None], today)
+    assert result.values[:2] == [datetime(2030, 6, 16), datetime(2030, 6, 15)]
+    assert rows(result) == [2, 3, 4]
+
+
+def test_combine_masks():
+    masks = [validate_quantities([1, 0, 1]).mask, validate_prices([1, 1, -1]).mask]
+    assert list(combine_masks(masks, 3)) == [True, False, False]
+
+
+def test_execute_rejects_a_price_too_big_for_a_float():
+    cart = ShoppingCart()
+    record = {"type": "Toys", "name": "Ball", "price": 10 ** 400, "quantity": 1, "brand": "Toyco",
+              "unique id": FIRST_ID, "minimum_age": 3, "gender": "M"}
+    reply = execute(cart, {"cmd": "A", "products": [record]})
+    assert not reply["ok"] and reply["added"] == 0
+    assert cart.number_of_products == 0
@@ -0,0 +1,185 @@
+# imports
+import math
+from collections import namedtuple
+from datetime import datetime
+
+from main import VALID_SIZES, VALID_GENDERS, TRUE_VALUES, FALSE_VALUES, DATE_FORMAT, ID_LENGTH, PRODUCT_TYPES
+
+try:  # NumPy is optional, it only makes the numeric checks faster on large columns
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+Batch validation of product fields. Each validate_* function takes a whole column of values (for
+example every price in an imported file) and returns a ColumnResult holding:
+    mask   - True for every valid value (a NumPy bool array when NumPy is installed, otherwise a list)
+    values - the converted values (floats, ints, upper case sizes, datetimes...), None where invalid
+    errors - a FieldError for every invalid value, with its row number in the column
+Nothing is printed, and dates are parsed once per distinct string with "today" taken once per batch.
+"""
+
+FieldError = namedtuple("FieldError", ["row", "field", "value", "message"])
+ColumnResult = namedtuple("ColumnResult", ["mask", "values", "errors"])
+
+SMALLEST_ID = 10 ** (ID_LENGTH - 1)
+LARGEST_ID = 10 ** ID_LENGTH - 1
+
+
+def _result(field, raw, values, ok, message):  # build the ColumnResult from a list of per-row flags
+    errors = [FieldError(i, field, raw[i], message) for i, good in enumerate(ok) if not good]
+    values = [v if good else None for v, good in zip(values, ok)]
+    mask = np.array(ok, dtype=bool) if np is not None else list(ok)
+    return ColumnResult(mask, values, errors)
+
+
+def _to_int(value):  # whole numbers or strings of them, anything else (including bools and floats) is None
+    if type(value) is int:
+        return value
+    if type(value) is str:
+        try:
+            return int(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _to_float(value):
+    if type(value) is float:
+        return value
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError, OverflowError):  # OverflowError for ints too big to be a float
+        return None
+
+
+def _numeric_column(values, convert, dtype):  # converted values, using NumPy to convert all at once if possible
+    # NumPy would turn True into 1 in a column mixing bools and numbers, so such columns are checked one by one
+    if np is not None and bool not in set(map(type, values)):
+        array = np.asarray(values)
+        if array.dtype.kind in dtype:  # the column was already numbers of the right kind
+            return array.tolist(), array
+    converted = [convert(v) for v in values]
+    return converted, None
+
+
+def validate_prices(prices, field="price"):  # prices must be finite numbers bigger than 0, so not inf or nan
+    converted, array = _numeric_column(prices, _to_float, "fi")
+    if array is not None:
+        ok = ((array > 0) & np.isfinite(array)).tolist()
+        converted = [float(v) for v in converted]
+    else:
+        ok = [v is not None and math.isfinite(v) and v > 0 for v in converted]
+    return _result(field, prices, converted, ok, "must be a number bigger than 0")
+
+
+def validate_quantities(quantities, field="quantity"):  # quantities must be whole numbers bigger than 0
+    converted, array = _numeric_column(quantities, _to_int, "iu")
+    if array is not None:
+        ok = (array > 0).tolist()
+    else:
+        ok = [v is not None and v > 0 for v in converted]
+    return _result(field, quantities, converted, ok, "must be a whole number bigger than 0")
+
+
+"""
+validate_ids function will check that every id is a 13 digit whole number which is not repeated within
+the column and is not in existing (any container of ids already used, such as cart.getIds()). With
+repeats true an id may be used more than once, as when the cart merges products on their unique id
+"""
+
+
+def validate_ids(ids, existing=(), field="unique id", repeats=False):
+    converted, array = _numeric_column(ids, _to_int, "iu")
+    if array is not None:
+        ok = (array >= SMALLEST_ID) & (array <= LARGEST_ID)
+        if not repeats:
+            first = np.zeros(len(array), dtype=bool)
+            first[np.unique(array, return_index=True)[1]] = True  # only the first use of an id is allowed
+            ok = ok & first
+        ok = ok.tolist()
+    else:
+        seen = set()
+        ok = []
+        for v in converted:
+            ok.append(v is not None and SMALLEST_ID <= v <= LARGEST_ID and (repeats or v not in seen))
+            seen.add(v)
+    if existing:
+        ok = [good and v not in existing for v, good in zip(converted, ok)]
+    return _result(field, ids, converted, ok, "must be a new {} digit ID number".format(ID_LENGTH))
+
+
+def _choice_column(values, field, choices, normalise, message):  # values which must be one of a few choices
+    ok = []
+    converted = []
+    for v in values:
+        v = normalise(v.strip()) if type(v) is str else None
+        ok.append(v in choices)
+        converted.append(v)
+    return _result(field, values, converted, ok, message)
+
+
+def validate_sizes(sizes, field="size"):
+    return _choice_column(sizes, field, set(VALID_SIZES), str.upper,
+                          "must be one of {}".format(", ".join(VALID_SIZES)))
+
+
+def validate_genders(genders, field="gender"):  # stored title case, as the interactive prompt does
+    return _choice_column(genders, field, set(g.title() for g in VALID_GENDERS), str.title,
+                          "must be one of {}".format(", ".join(VALID_GENDERS)))
+
+
+def validate_types(types, field="type"):
+    return _choice_column(types, field, set(PRODUCT_TYPES), str.strip,
+                          "must be one of {}".format(", ".join(PRODUCT_TYPES)))
+
+
+def validate_text(values, field):  # non-empty strings such as names, brands and materials
+    ok = [type(v) is str and bool(v.strip()) for v in values]
+    return _result(field, values, values, ok, "must be a non-empty string")
+
+
+def validate_bools(values, field):  # real booleans or one of the accepted true/false words
+    converted = []
+    for v in values:
+        if type(v) is not bool:
+            word = v.lower() if type(v) is str else None
+            v = True if word in TRUE_VALUES else False if word in FALSE_VALUES else None
+        converted.append(v)
+    ok = [v is not None for v in converted]
+    return _result(field, values, converted, ok, "must be a boolean")
+
+
+def validate_expiry_dates(dates, today=None, field="expiry date"):  # DD/MM/YYYY dates which have not passed
+    today = today or datetime.today()
+    parsed = {}  # each distinct string is only parsed once
+    converted = []
+    ok = []
+    for v in dates:
+        if type(v) is not str:
+            date = None
+        elif v in parsed:
+            date = parsed[v]
+        else:
+            try:
+                date = datetime.strptime(v, DATE_FORMAT)
+            except ValueError:
+                date = None
+            parsed[v] = date
+        converted.append(date)
+        ok.append(date is not None and date >= today)
+    return _result(field, dates, converted, ok, "must be a DD/MM/YYYY date in the future")
+
+
+def combine_masks(masks, size):  # True for rows valid in every mask
+    if np is not None:
+        combined = np.ones(size, dtype=bool)
+        for mask in masks:
+            combined &= mask
+        return combined
+    combined = [True] * size
+    for mask in masks:
+        combined = [a and b for a, b in zip(combined, mask)]
+    return combined